@@ -0,0 +1,62 @@
+"""Compare memory use of `extract_corpus` for a whole corpus and in chunks.
+
+    python benchmarks/bench_chunks.py [N_RECORDS] [CHUNK_SIZE]
+
+Reports the peak of traced allocations during a run which writes a CLDF dataset.
+"""
+import json
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import DATA, make_corpus, report, run_isolated  # noqa: E402
+
+
+def child(corpus, chunk_size):
+    import unboxer  # pylint: disable=import-outside-toplevel
+    from unboxer.helpers import (  # pylint: disable=import-outside-toplevel
+        load_default_config,
+    )
+
+    logging.getLogger("unboxer").setLevel(logging.ERROR)
+    conf = load_default_config("toolbox")
+    conf["lang_id"] = "pemo1248"
+    out = Path(corpus).parent / f"out_{chunk_size}"
+    out.mkdir(exist_ok=True)
+    tracemalloc.start()
+    tick = time.perf_counter()
+    unboxer.extract_corpus(
+        [Path(corpus)],
+        conf=conf,
+        output_dir=out,
+        cldf=True,
+        languages=DATA / "languages.csv",
+        chunk_size=chunk_size or None,
+    )
+    tock = time.perf_counter()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    print(
+        json.dumps({"chunk_size": chunk_size, "seconds": tock - tick, "peak_mb": peak})
+    )
+
+
+def main(n_records=5000, chunk_size=500):
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = make_corpus(Path(tmp) / "corpus.txt", n_records)
+        rows = [
+            run_isolated(__file__, "--child", corpus, size) for size in [0, chunk_size]
+        ]
+    report(f"extract_corpus with CLDF output, {n_records} records", rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(*[int(x) for x in sys.argv[1:]])
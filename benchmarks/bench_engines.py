@@ -0,0 +1,63 @@
+"""Compare the pandas and polars engines for cleaning and normalizing records.
+
+    python benchmarks/bench_engines.py [N_RECORDS]
+
+Needs polars. The records are parsed fields, as they come from `_read_records`.
+"""
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import report  # noqa: E402
+
+from unboxer.engines import PandasEngine, PolarsEngine  # noqa: E402
+
+ALIGNED = ["Analyzed_Word", "Gloss", "Part_Of_Speech"]
+CONF = {
+    "interlinear_mappings": {
+        "\\tx": "Primary_Text",
+        "\\mb": "Analyzed_Word",
+        "\\ge": "Gloss",
+        "\\ps": "Part_Of_Speech",
+    },
+    "skip_empty_obj": True,
+}
+
+
+def make_frame(n_records):
+    row = {
+        "\\ref": "rec",
+        "\\tx": "ene  pe  moro\nwitu=ya  tîse",
+        "\\mb": "ene - pe  moro\twi -tu =ya tî -se ",
+        "\\ge": " see - 3  that\tgo - NMLZ = ERG go -INF",
+        "\\ps": "v -n  dem v -  n  =p v - n",
+    }
+    empty = {**row, "\\ge": "", "\\tx": ""}
+    return pd.DataFrame(
+        [row] * (n_records - n_records // 10) + [empty] * (n_records // 10)
+    )
+
+
+def run(engine, df):
+    df = engine.clean(df, CONF)
+    return engine.normalize(df, ALIGNED)
+
+
+def main(n_records=100000):
+    df = make_frame(n_records)
+    rows = []
+    results = {}
+    for engine in [PandasEngine(), PolarsEngine()]:
+        tick = time.perf_counter()
+        results[engine.name] = run(engine, df.copy())
+        rows.append({"version": engine.name, "seconds": time.perf_counter() - tick})
+    assert results["pandas"].astype(str).equals(results["polars"].astype(str))
+    report(f"cleaning and normalization, {n_records} records", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,64 @@
+"""Compare the morph inventory built without a lexicon with the previous
+token-by-token version.
+
+    python benchmarks/bench_inventory.py [N_RECORDS] [N_FORMS]
+
+Every record has 10 tokens, taken from `N_FORMS` distinct object-gloss pairs.
+"""
+import re
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import report  # noqa: E402
+
+from unboxer import _collect_morphs  # noqa: E402
+from unboxer.context import ExtractionContext, humidify  # noqa: E402
+
+
+def old(df, morphs):
+    tdf = df[["Analyzed_Word", "Gloss"]].copy()
+    for c in ["Analyzed_Word", "Gloss"]:
+        tdf[c] = df[c].apply(lambda x: re.split(r"\s+", x))
+    for rec in tdf.to_dict("records"):
+        for obj, gloss in zip(rec["Analyzed_Word"], rec["Gloss"]):
+            if obj == "":
+                continue
+            morph_id = humidify(obj + "-" + gloss, key="pairs")
+            if morph_id not in morphs:
+                morphs[morph_id] = {
+                    "ID": morph_id,
+                    "Form": obj,
+                    "Meaning": gloss.strip("-").strip("="),
+                }
+    return morphs
+
+
+def make_frame(n_records, n_forms):
+    words, glosses = [], []
+    for i in range(n_records):
+        forms = [(i * 7 + j * 13) % n_forms for j in range(10)]
+        words.append(" ".join(f"w{x} -pe" if x % 3 else f"w{x}" for x in forms))
+        glosses.append(" ".join(f"G{x} -PL" if x % 3 else f"G{x}" for x in forms))
+    return pd.DataFrame({"Analyzed_Word": words, "Gloss": glosses})
+
+
+def main(n_records=100000, n_forms=20000):
+    df = make_frame(n_records, n_forms)
+    rows = []
+    results = {}
+    for name, func in [("per token", old), ("unique pairs", _collect_morphs)]:
+        with ExtractionContext().activate():
+            tick = time.perf_counter()
+            results[name] = func(df, {})
+        rows.append({"version": name, "seconds": time.perf_counter() - tick})
+    assert results["per token"] == results["unique pairs"]
+    report(f"morph inventory, {n_records} records", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,73 @@
+"""Compare memory use of `extract_corpus` with and without `low_memory`.
+
+    python benchmarks/bench_low_memory.py [N_RECORDS]
+
+Reports the peak of traced allocations during the run and the size of the
+tables the run holds in memory until they are written (examples, wordforms
+and the slice tables), as they are added to them.
+"""
+import json
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import make_corpus, report, run_isolated  # noqa: E402
+
+
+def child(corpus, low_memory):
+    import unboxer  # pylint: disable=import-outside-toplevel
+    from unboxer.chunks import ChunkedTable  # pylint: disable=import-outside-toplevel
+    from unboxer.helpers import (  # pylint: disable=import-outside-toplevel
+        load_default_config,
+    )
+
+    held = []
+    append = ChunkedTable.append
+
+    def measured_append(self, df):
+        if df is not None:
+            held.append(df.memory_usage(deep=True).sum())
+        append(self, df)
+
+    ChunkedTable.append = measured_append
+    logging.getLogger("unboxer").setLevel(logging.ERROR)
+    conf = load_default_config("toolbox")
+    out = Path(corpus).parent / f"out_{low_memory}"
+    out.mkdir(exist_ok=True)
+    tracemalloc.start()
+    tick = time.perf_counter()
+    unboxer.extract_corpus(
+        [Path(corpus)], conf=conf, output_dir=out, low_memory=low_memory
+    )
+    tock = time.perf_counter()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    print(
+        json.dumps(
+            {
+                "low_memory": low_memory,
+                "seconds": tock - tick,
+                "peak_mb": peak,
+                "tables_mb": sum(held) / 2**20,
+            }
+        )
+    )
+
+
+def main(n_records=20000):
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = make_corpus(Path(tmp) / "corpus.txt", n_records)
+        rows = [run_isolated(__file__, "--child", corpus, mode) for mode in ["", "1"]]
+    report(f"extract_corpus, {n_records} records", rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], bool(sys.argv[3]))
+    else:
+        main(*[int(x) for x in sys.argv[1:]])
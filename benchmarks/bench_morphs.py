@@ -0,0 +1,67 @@
+"""Compare the columnar `extract_morphs` with the previous record-wise version.
+
+    python benchmarks/bench_morphs.py [N_ENTRIES] [N_VARIANTS]
+"""
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import report  # noqa: E402
+
+from unboxer import extract_morphs  # noqa: E402
+
+SEP = "; "
+
+
+def old(lexicon, sep):
+    morphs = []
+    morphemes = []
+    for rec in lexicon.to_dict("records"):
+        m_id = rec["ID"]
+        dic = {
+            "Meaning": rec["Meaning"],
+            "Part_Of_Speech": rec["Part_Of_Speech"],
+            "Morpheme_ID": m_id,
+        }
+        morphs.append({**{"Form": rec["Headword"], "ID": rec["ID"]}, **dic})
+        if "Variants" in rec and rec["Variants"] != "":
+            for c, x in enumerate(rec["Variants"].split(sep)):
+                morphs.append({**{"Form": x, "ID": f"{m_id}-{c}"}, **dic})
+        morphemes.append(rec)
+    return pd.DataFrame.from_dict(morphemes), pd.DataFrame.from_dict(morphs)
+
+
+def make_lexicon(n_entries, n_variants):
+    return pd.DataFrame(
+        {
+            "ID": [f"m{i}" for i in range(n_entries)],
+            "Headword": [f"form{i}" for i in range(n_entries)],
+            "Meaning": [f"meaning{i}; other" for i in range(n_entries)],
+            "Part_Of_Speech": ["n", "v"] * (n_entries // 2) + ["n"] * (n_entries % 2),
+            "Variants": [
+                SEP.join(f"var{i}-{j}" for j in range(i % (n_variants + 1)))
+                for i in range(n_entries)
+            ],
+        }
+    )
+
+
+def main(n_entries=100000, n_variants=3):
+    lexicon = make_lexicon(n_entries, n_variants)
+    rows = []
+    results = {}
+    for name, func in [("record-wise", old), ("columnar", extract_morphs)]:
+        tick = time.perf_counter()
+        results[name] = func(lexicon, SEP)
+        rows.append({"version": name, "seconds": time.perf_counter() - tick})
+    for before, after in zip(results["record-wise"], results["columnar"]):
+        pd.testing.assert_frame_equal(before, after)
+    report(f"extract_morphs, {n_entries} entries", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,72 @@
+"""Compare the normalization of aligned fields with the previous row-wise steps.
+
+    python benchmarks/bench_normalize.py [N_RECORDS]
+
+The old version removed spaces per column, fixed glosses per row, fixed
+clitics per column and then cleaned up the primary text.
+"""
+import re
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import report  # noqa: E402
+
+from unboxer.helpers import fix_glosses, normalize_frame  # noqa: E402
+
+ALIGNED = ["Analyzed_Word", "Gloss", "Part_Of_Speech"]
+
+
+def _remove_spaces(text):
+    for sep in ["- ", " -"]:
+        while sep in text:
+            text = text.replace(sep, sep.strip())
+    return re.sub(r"\s+", "\t", text)
+
+
+def _fix_clitics(string):
+    return string.replace("=\t", "=").replace("\t=", "=")
+
+
+def old(df):
+    for col in ALIGNED:
+        df[col] = df[col].apply(_remove_spaces)
+    df = df.apply(fix_glosses, axis=1)
+    for col in ALIGNED:
+        df[col] = df[col].apply(_fix_clitics)
+    df["Primary_Text"] = df["Primary_Text"].apply(lambda x: re.sub(r"\s+", " ", x))
+    return df
+
+
+def new(df):
+    return normalize_frame(df, ALIGNED)
+
+
+def make_frame(n_records):
+    row = {
+        "Primary_Text": "ene  pe  moro\nwitu=ya  tîse",
+        "Analyzed_Word": "ene - pe  moro\twi -tu =ya tî -se ",
+        "Gloss": " see - 3  that\tgo - NMLZ = ERG go -INF",
+        "Part_Of_Speech": "v -n  dem v -  n  =p v - n",
+    }
+    return pd.DataFrame([row] * n_records)
+
+
+def main(n_records=50000):
+    df = make_frame(n_records)
+    rows = []
+    results = {}
+    for name, func in [("row-wise", old), ("single pass", new)]:
+        tick = time.perf_counter()
+        results[name] = func(df.copy())
+        rows.append({"version": name, "seconds": time.perf_counter() - tick})
+    assert results["row-wise"].equals(results["single pass"])
+    report(f"normalization, {n_records} records", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
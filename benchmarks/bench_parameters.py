@@ -0,0 +1,75 @@
+"""Compare the assembly of the parameter table with the previous list-based
+membership checks.
+
+    python benchmarks/bench_parameters.py [N_MEANINGS] [N_MEANINGS_OLD]
+
+Half of the morph and stem meanings are also wordform meanings. The old version
+is quadratic (about 20 seconds for 10k meanings), so it only gets `N_MEANINGS_OLD`.
+"""
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import report  # noqa: E402
+
+from unboxer import _without_ids  # noqa: E402
+
+
+def make_meanings(n_meanings):
+    form_meanings = pd.DataFrame(
+        {
+            "ID": [f"meaning-{i}" for i in range(0, 2 * n_meanings, 2)],
+            "Name": [f"meaning {i}" for i in range(0, 2 * n_meanings, 2)],
+        }
+    )
+    morph_meanings = {
+        f"meaning {i}": {"ID": f"meaning-{i}", "Name": f"meaning {i}"}
+        for i in range(n_meanings)
+    }
+    stem_meanings = {
+        f"meaning {i}": {"ID": f"meaning-{i}", "Name": f"meaning {i}"}
+        for i in range(n_meanings, n_meanings + n_meanings // 10)
+    }
+    return form_meanings, morph_meanings, stem_meanings
+
+
+def old(form_meanings, morph_meanings, stem_meanings):
+    morph_meanings = pd.DataFrame.from_dict(
+        [x for x in morph_meanings.values() if x["ID"] not in list(form_meanings["ID"])]
+    )
+    stem_meanings = pd.DataFrame.from_dict(
+        [x for x in stem_meanings.values() if x["ID"] not in list(form_meanings["ID"])]
+    )
+    return pd.concat([form_meanings, morph_meanings, stem_meanings])
+
+
+def new(form_meanings, morph_meanings, stem_meanings):
+    morph_meanings = _without_ids(morph_meanings.values(), form_meanings["ID"])
+    stem_meanings = _without_ids(stem_meanings.values(), form_meanings["ID"])
+    return pd.concat([form_meanings, morph_meanings, stem_meanings])
+
+
+def main(n_meanings=100000, n_meanings_old=10000):
+    rows = []
+    results = {}
+    for name, func, n in [
+        ("lists", old, n_meanings_old),
+        ("sets", new, n_meanings_old),
+        ("sets", new, n_meanings),
+    ]:
+        meanings = make_meanings(n)
+        tick = time.perf_counter()
+        results[name, n] = func(*meanings)
+        rows.append(
+            {"version": name, "meanings": n, "seconds": time.perf_counter() - tick}
+        )
+    assert results["lists", n_meanings_old].equals(results["sets", n_meanings_old])
+    report("parameter table", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
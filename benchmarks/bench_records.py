@@ -0,0 +1,86 @@
+"""Compare parsing records into a list of dicts with `RecordColumns`.
+
+    python benchmarks/bench_records.py [N_RECORDS]
+
+The old version built field contents with repeated `+=` and kept one dict per
+record until the dataframe was created. Reports the time to parse the records
+and create the dataframe, and the peak of traced allocations.
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import make_corpus, report  # noqa: E402
+
+from unboxer import _get_fields, _iter_records  # noqa: E402
+from unboxer.chunks import RecordColumns  # noqa: E402
+
+
+def _old_get_fields(record, rec_marker, multiple, sep):
+    out = {}
+    marker = None
+    for line in record.split("\n"):
+        if line == "":
+            continue
+        if not line.startswith("\\"):
+            out[marker] += " " + line
+        elif " " in line:
+            marker, content = line.split(" ", 1)
+            content = content.strip(" ")
+            if marker in out:
+                if marker not in multiple:
+                    out[marker] += " " + content
+                else:
+                    out[marker] += sep + content
+            else:
+                out[marker] = content
+        else:
+            out[line] = ""
+    if "".join([v for k, v in out.items() if k != rec_marker]) == "":
+        return None
+    return out
+
+
+def old(corpus):
+    recs = []
+    for record in _iter_records(corpus, "\\ref ", "utf-8"):
+        res = _old_get_fields("\\ref " + record, "\\ref", [], "; ")
+        if res:
+            recs.append(res)
+    return pd.DataFrame.from_dict(recs)
+
+
+def new(corpus):
+    recs = RecordColumns()
+    for record in _iter_records(corpus, "\\ref ", "utf-8"):
+        res = _get_fields("\\ref " + record, "\\ref", [], "; ")
+        if res:
+            recs.append(res)
+    return recs.to_frame()
+
+
+def main(n_records=100000):
+    rows = []
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = make_corpus(Path(tmp) / "corpus.txt", n_records)
+        for name, func in [("dicts", old), ("columns", new)]:
+            tracemalloc.start()
+            tick = time.perf_counter()
+            results[name] = func(corpus)
+            seconds = time.perf_counter() - tick
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            rows.append({"version": name, "seconds": seconds, "peak MiB": peak})
+    assert results["dicts"].equals(results["columns"])
+    report(f"parsing {n_records} records", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,70 @@
+"""Compare the `replace` rules applied by a `Replacer` with one regex pass per
+rule and table.
+
+    python benchmarks/bench_replace.py [N_FORMS] [N_RULES]
+
+Wordforms are made of 2000 distinct forms; morphs repeat 500 of them.
+"""
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import report  # noqa: E402
+
+from unboxer.helpers import Replacer  # noqa: E402
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def make_rules(n_rules):
+    rules = {}
+    for i in range(n_rules):
+        a, b = LETTERS[i % 26], LETTERS[(i * 7 + 3) % 26]
+        rules[f"{a}{b}" if i % 2 else f"^{a}"] = b.upper() if i % 3 else b
+    return rules
+
+
+def make_tables(n_forms):
+    forms = [
+        "".join(LETTERS[(i * j + j) % 26] for j in range(3 + i % 6))
+        for i in range(2000)
+    ]
+    wordforms = pd.DataFrame({"Form": [forms[i % 2000] for i in range(n_forms)]})
+    morphs = pd.DataFrame({"Form": [forms[i % 500] for i in range(n_forms // 10)]})
+    return wordforms, morphs
+
+
+def old(tables, rules):
+    for df in tables:
+        for orig, repl in rules.items():
+            df["Form"] = df["Form"].replace(orig, repl, regex=True)
+    return tables
+
+
+def new(tables, rules):
+    replace = Replacer(rules)
+    for df in tables:
+        df["Form"] = replace.apply(df["Form"])
+    return tables
+
+
+def main(n_forms=200000, n_rules=40):
+    rules = make_rules(n_rules)
+    rows = []
+    results = {}
+    for name, func in [("per rule", old), ("replacer", new)]:
+        tables = make_tables(n_forms)
+        tick = time.perf_counter()
+        results[name] = func(tables, rules)
+        rows.append({"version": name, "seconds": time.perf_counter() - tick})
+    for before, after in zip(results["per rule"], results["replacer"]):
+        assert before.equals(after)
+    report(f"replace rules, {n_rules} rules, {n_forms} wordforms", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,79 @@
+"""Compare morph lookups in `unbox serve` with a plain `Morphinder` on the morph table.
+
+    python benchmarks/bench_serve.py [N_MORPHS] [N_QUERIES]
+
+Queries are drawn from the morph table with repetitions (as in running text),
+plus some forms which are not in the table.
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from morphinder import Morphinder
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from common import report  # noqa: E402
+
+from unboxer.server import Lookup  # noqa: E402
+
+
+def make_morphs(n_morphs):
+    return pd.DataFrame(
+        {
+            "Form": [f"m{i % (n_morphs // 2)}" for i in range(n_morphs)],
+            "ID": [f"m{i}" for i in range(n_morphs)],
+            "Meaning": [f"gloss{i}" for i in range(n_morphs)],
+            "Part_Of_Speech": ["n"] * n_morphs,
+            "Morpheme_ID": [f"m{i}" for i in range(n_morphs)],
+        }
+    )
+
+
+def make_queries(morphs, n_queries):
+    rng = random.Random(1)
+    pairs = list(zip(morphs["Form"], morphs["Meaning"]))[:500]
+    pairs += [(f"x{i}", "none") for i in range(50)]
+    return [rng.choice(pairs) for _ in range(n_queries)]
+
+
+def old(morphs, queries):
+    morphinder = Morphinder(morphs, complain=False)
+    res = []
+    for form, gloss in queries:
+        morph_id = morphinder.retrieve_morph_id(
+            form, gloss, "", gloss_key="Meaning", type_key="Part_Of_Speech"
+        )[0]
+        res.append(morph_id)
+    return res
+
+
+def new(lookup, queries):
+    res = []
+    for form, gloss in queries:
+        morph = lookup.query("/analyze", (("form", form), ("gloss", gloss)))[1]["morph"]
+        res.append(morph["ID"] if morph else None)
+    return res
+
+
+def main(n_morphs=20000, n_queries=5000):
+    morphs = make_morphs(n_morphs)
+    queries = make_queries(morphs, n_queries)
+    with tempfile.TemporaryDirectory() as tmp:
+        morphs.to_csv(Path(tmp) / "morphs.csv", index=False)
+        lookup = Lookup(tmp)
+    rows = []
+    tick = time.perf_counter()
+    expected = old(morphs, queries)
+    rows.append({"version": "morphinder", "seconds": time.perf_counter() - tick})
+    tick = time.perf_counter()
+    assert new(lookup, queries) == expected
+    rows.append({"version": "serve", "seconds": time.perf_counter() - tick})
+    report(f"{n_queries} lookups, {n_morphs} morphs", rows)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
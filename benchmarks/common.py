@@ -0,0 +1,52 @@
+"""Helpers for the benchmark scripts: synthetic corpora and isolated runs."""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+DATA = Path(__file__).parent.parent / "tests" / "data"
+
+
+def make_corpus(path, n_records, source=DATA / "pem_txt_tb.txt"):
+    """Write a toolbox corpus with `n_records` records by repeating the test corpus.
+
+    Every copy gets its own record IDs, so nothing is dropped as a duplicate.
+    """
+    content = source.read_text(encoding="utf-8")
+    header, *records = content.split("\\ref ")
+    out = [header]
+    i = 0
+    while len(out) <= n_records:
+        for record in records:
+            rec_id, rest = record.split("\n", 1)
+            out.append(f"c{i}{rec_id.strip()}\n{rest}")
+            if len(out) > n_records:
+                break
+        i += 1
+    Path(path).write_text("\\ref ".join(out), encoding="utf-8")
+    return path
+
+
+def run_isolated(script, *args):
+    """Run a benchmark script in a fresh interpreter (so that memory measurements
+    do not affect each other) and return the JSON it prints as its last line."""
+    res = subprocess.run(
+        [sys.executable, str(script), *[str(x) for x in args]],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(res.stdout.strip().split("\n")[-1])
+
+
+def report(title, rows):
+    print(title)
+    keys = list(rows[0].keys())
+    print("  ".join(f"{k:>14}" for k in keys))
+    for row in rows:
+        print(
+            "  ".join(
+                f"{v:>14.3f}" if isinstance(v, float) else f"{v!s:>14}"
+                for v in row.values()
+            )
+        )
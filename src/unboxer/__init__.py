@@ -1,13 +1,24 @@
 """Top-level package for unboxer."""
+import contextvars
+import copy
+import hashlib
 import logging
+import random
 import re
+import shutil
 import sys
-from itertools import combinations
+import tempfile
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain, combinations, islice
 from pathlib import Path
 
 import colorlog
+import numpy as np
 import pandas as pd
-from humidifier import Humidifier, get_values, humidify
+from humidifier import Humidifier
 from Levenshtein import distance
 from morphinder import Morphinder, identify_complex_stem_position
 from segments import Profile, Tokenizer
@@ -15,12 +26,21 @@ from tqdm import tqdm
 from writio import dump, load
 
 from unboxer import helpers
+from unboxer.checkpoints import Checkpoints, stage_key
+from unboxer.chunks import ChunkedTable, RecordColumns
 from unboxer.cldf import (
     create_cldf,
     create_dictionary_cldf,
+    create_partitioned_cldf,
     create_wordlist_cldf,
     get_lexical_data,
+    load_languages,
 )
+from unboxer.context import get_values, humidify, run_scoped
+from unboxer.diagnostics import Diagnostics, attach_log_file, detach_log_file
+from unboxer.engines import get_engine
+from unboxer.export import WRITERS
+from unboxer.sqlite import write_sqlite
 
 handler = colorlog.StreamHandler(None)
 handler.setFormatter(
@@ -32,13 +52,6 @@ log.propagate = True
 log.addHandler(handler)
 
 
-def _remove_spaces(text):
-    for sep in ["- ", " -"]:
-        while sep in text:
-            text = text.replace(sep, sep.strip())
-    return re.sub(r"\s+", "\t", text)
-
-
 def id_glosses(gloss, sep=None):
     res = [humidify(g, key="glosses") for g in re.split(r"\.\b", gloss)]
     if sep:
@@ -47,56 +60,93 @@ def id_glosses(gloss, sep=None):
 
 
 def _get_fields(record, rec_marker, multiple, sep):
-    out = {}
+    parts = {}  # marker: pieces of its content, joined at the end
     marker = None
     for line in record.split("\n"):
         if line == "":
             continue
         if not line.startswith("\\"):
-            out[marker] += " " + line
+            parts[marker] += [" ", line]
         elif " " in line:
             marker, content = line.split(" ", 1)
+            marker = sys.intern(marker)
             content = content.strip(" ")
-            if marker in out:
-                if marker not in multiple:
-                    out[marker] += " " + content
-                else:
-                    out[marker] += sep + content
+            if marker in parts:
+                parts[marker] += [sep if marker in multiple else " ", content]
             else:
-                out[marker] = content
+                parts[marker] = [content]
         else:
-            out[line] = ""
-    if "".join([v for k, v in out.items() if k != rec_marker]) == "":
+            parts[sys.intern(line)] = [""]
+    out = {k: "".join(v) for k, v in parts.items()}
+    if not any(v for k, v in out.items() if k != rec_marker):
         return None
     return out
 
 
-def _fix_clitics(string):
-    string = string.replace("=\t", "=").replace("\t=", "=")
-    return string
+def _record_hash(rec):
+    return hashlib.blake2b(
+        "\n".join(f"{k} {v}" for k, v in rec.items()).encode("utf-8"),
+        digest_size=16,
+    ).digest()
+
+
+def _check_duplicate(rec, record_marker, seen, filename, hash_content=True):
+    """Registers a record in `seen` and returns a report entry if its key is already known."""
+    key = rec.get(record_marker)
+    digest = _record_hash(rec) if hash_content else None
+    if key not in seen:
+        seen[key] = (filename, digest)
+        return None
+    first_file, first_digest = seen[key]
+    if not hash_content:
+        kind = "duplicate"
+    elif digest == first_digest:
+        kind = "identical"
+    else:
+        kind = "conflict"
+    return {
+        "Record": key,
+        "Type": kind,
+        "filename": Path(filename).name,
+        "Kept_From": Path(first_file).name,
+    }
 
 
 def extract_morphs(lexicon, sep):
-    morphs = []
-    morphemes = []
-    for rec in lexicon.to_dict("records"):
-        m_id = rec["ID"]
-        try:
-            dic = {
-                "Meaning": rec["Meaning"],
-                "Part_Of_Speech": rec["Part_Of_Speech"],
-                "Morpheme_ID": m_id,
-            }
-        except KeyError as e:
-            log.error(f"Please define {e} in lexicon_mappings in your conf.")
-            print(rec)
+    """Get the morphemes and morphs (headwords and variants) of a lexicon.
+
+    Variants get IDs like `<morpheme ID>-<index>` and follow their headword.
+    """
+    if len(lexicon) == 0:
+        return pd.DataFrame(), pd.DataFrame()
+    for col in ["Meaning", "Part_Of_Speech"]:
+        if col not in lexicon.columns:
+            log.error(f"Please define '{col}' in lexicon_mappings in your conf.")
             sys.exit()
-        morphs.append({**{"Form": rec["Headword"], "ID": rec["ID"]}, **dic})
-        if "Variants" in rec and rec["Variants"] != "":
-            for c, x in enumerate(rec["Variants"].split(sep)):
-                morphs.append({**{"Form": x, "ID": f"{m_id}-{c}"}, **dic})
-        morphemes.append(rec)
-    return pd.DataFrame.from_dict(morphemes), pd.DataFrame.from_dict(morphs)
+    lexicon = lexicon.reset_index(drop=True)
+    morphs = pd.DataFrame(
+        {
+            "Form": lexicon["Headword"],
+            "ID": lexicon["ID"],
+            "Meaning": lexicon["Meaning"],
+            "Part_Of_Speech": lexicon["Part_Of_Speech"],
+            "Morpheme_ID": lexicon["ID"],
+        }
+    )
+    has_variants = lexicon.get("Variants", pd.Series("", index=lexicon.index)) != ""
+    if has_variants.any():
+        variants = (
+            morphs[has_variants]
+            .assign(Form=lexicon["Variants"][has_variants].str.split(sep))
+            .explode("Form")
+        )
+        variants["ID"] = (
+            variants["ID"] + "-" + variants.groupby(level=0).cumcount().astype(str)
+        )
+        # variants follow their headword
+        morphs = pd.concat([morphs, variants]).sort_index(kind="stable")
+        morphs = morphs.reset_index(drop=True).astype({"Form": morphs["ID"].dtype})
+    return lexicon, morphs
 
 
 def tuplify(x):
@@ -115,6 +165,45 @@ def listify(x):
     return x
 
 
+def _split_words(text):
+    # keep affixes separated by spaces in the same word, joined with INTERN
+    text = re.sub(r"-\s+", "-INTERN", text)
+    text = re.sub(r"\s+-", "INTERN-", text)
+    return re.split(r"\s+", text)
+
+
+def _key(registry, value):
+    return registry.setdefault(value, len(registry))
+
+
+def _decode(codes, registry):
+    return pd.Categorical.from_codes(np.asarray(codes), categories=list(registry))
+
+
+def _add_id(df, *cols, sep="-"):
+    """Insert an `ID` column composed of other columns."""
+    if df is None or "ID" in df.columns:
+        return df
+    df = df.copy()
+    if len(df) == 0:
+        df.insert(0, "ID", pd.Series(dtype=object))
+        return df
+    ids = df[cols[0]].astype(str)
+    for col in cols[1:]:
+        ids = ids + sep + df[col].astype(str)
+    df.insert(0, "ID", ids)
+    return df
+
+
+def materialize_ids(sentence_slices=None, morph_slices=None, wordformstems=None):
+    """Create the human-readable IDs of slice tables built with `ids=False`."""
+    return (
+        _add_id(sentence_slices, "Example_ID", "Index"),
+        _add_id(morph_slices, "Wordform_ID", "Morph_ID", "Index"),
+        _add_id(wordformstems, "Stem_ID", "Wordform_ID", sep=""),
+    )
+
+
 def build_slices(
     df,
     morphinder=None,
@@ -123,15 +212,52 @@ def build_slices(
     infl_cats=None,
     infl_vals=None,
     infl_morphemes=None,
+    low_memory=False,
+    ids=True,
+    seen=None,
+    diagnostics=None,
 ):  # pylint:ignore=too-many-arguments,too-many-locals
-    df = df.copy()
-    for c in [obj_key, gloss_key]:
-        df[c] = df[c].apply(lambda x: re.sub(r"-\s+", "-INTERN", x))
-        df[c] = df[c].apply(lambda x: re.sub(r"\s+-", "INTERN-", x))
-        df[c] = df[c].apply(lambda x: re.split(r"\s+", x))
+    """Split records into word and morph slices.
+
+    Internally, examples, wordforms, meanings and morphs are referred to by
+    integer keys; the resulting key columns are categoricals.
+    With `ids=False`, the composite slice IDs are not created, use `materialize_ids`.
+    When processing a corpus in chunks, pass the same `seen` dict for every chunk;
+    wordforms, meanings and stems from earlier chunks are then not repeated.
+    Warnings are collected in `diagnostics`; without one, they are logged at the end.
+    """
+    seen = {} if seen is None else seen
+    own_diagnostics = diagnostics is None
+    diagnostics = Diagnostics() if own_diagnostics else diagnostics
+    for key in ["wordforms", "meanings", "stems", "failed"]:
+        seen.setdefault(key, set())
     wfs = {}
-    w_slices = []
-    s_slices = []
+    # integer keys for repeated IDs
+    ex_keys, wf_keys, meaning_keys, morph_keys = {}, {}, {}, {}
+    # one array or list per column, repeated strings are only stored once
+    w_slices = {
+        "Wordform_ID": array("q"),
+        "Morph_ID": array("q"),
+        "Form_Meaning": array("q"),
+        "Gloss": [],
+        "Morpheme_Meaning": [],
+        "Form": [],
+        "Index": array("q"),
+    }
+    s_slices = {
+        "Example_ID": array("q"),
+        "Wordform_ID": array("q"),
+        "Form": [],
+        "Segmentation": [],
+        "Gloss": [],
+        "Parameter_ID": array("q"),
+        "Index": array("q"),
+    }
+    strings = {}
+
+    def shared(text):
+        return strings.setdefault(text, text)
+
     inflections = []
     infl_tuples = {}
     wordformstems = []
@@ -144,19 +270,26 @@ def build_slices(
     w_meanings = {}
     found_stems = {}
     stem_parts = []
-    for sentence in tqdm(df.to_dict("records"), desc="Building slices"):
+    for ex_id, ex_obj, ex_gloss in tqdm(
+        zip(df["ID"], df[obj_key], df[gloss_key]),
+        total=len(df),
+        desc="Building slices",
+    ):
+        ex_key = _key(ex_keys, ex_id)
         for s_idx, (obj, gloss) in enumerate(
-            zip(sentence[obj_key], sentence[gloss_key])
+            zip(_split_words(ex_obj), _split_words(ex_gloss))
         ):
             w_obj = obj.replace("INTERN", "")
             w_gloss = gloss.replace("INTERN", "")
             w_id = humidify(f"{w_obj}-{w_gloss}", "wordforms")
             meaning_id = humidify(w_gloss, "meanings")
-            if meaning_id not in w_meanings:
+            if meaning_id not in w_meanings and meaning_id not in seen["meanings"]:
                 w_meanings[meaning_id] = {"ID": meaning_id, "Name": w_gloss}
             if w_obj == "":
                 continue
-            if w_id not in wfs:
+            w_key = _key(wf_keys, w_id)
+            meaning_key = _key(meaning_keys, meaning_id)
+            if w_id not in wfs and w_id not in seen["wordforms"]:
                 if w_gloss != "":
                     wfs[w_id] = {
                         "ID": w_id,
@@ -188,28 +321,24 @@ def build_slices(
                         )
                         del sense
                         if morph_gloss == "":
-                            log.warning(
-                                f"Missing gloss for {morph_obj} in {sentence['ID']}"
-                            )
+                            diagnostics.add("Missing glosses", morph_obj, ex_id)
                             continue
                         if m_id:
-                            slice_id = f"{w_id}-{m_id}-{m_idx}"
-                            w_slices.append(
-                                {
-                                    "ID": slice_id,
-                                    "Wordform_ID": w_id,
-                                    "Morph_ID": m_id,
-                                    "Form_Meaning": meaning_id,
-                                    "Gloss": morph_gloss,
-                                    "Morpheme_Meaning": humidify(
-                                        morph_gloss, "gloss_meanings"
-                                    ),
-                                    "Form": morph_obj,
-                                    "Index": m_idx,
-                                }
-                            )
+                            for key, value in [
+                                ("Wordform_ID", w_key),
+                                ("Morph_ID", _key(morph_keys, m_id)),
+                                ("Form_Meaning", meaning_key),
+                                ("Gloss", shared(morph_gloss)),
+                                (
+                                    "Morpheme_Meaning",
+                                    humidify(morph_gloss, "gloss_meanings"),
+                                ),
+                                ("Form", shared(morph_obj)),
+                                ("Index", m_idx),
+                            ]:
+                                w_slices[key].append(value)
                         if m_id in infl_morphemes:
-                            infl_hits[m_id] = (morph_obj, slice_id)
+                            infl_hits[m_id] = (morph_obj, f"{w_id}-{m_id}-{m_idx}")
                         else:
                             stem_mids.append(m_id)
                     if len(infl_hits) > 1:
@@ -248,7 +377,6 @@ def build_slices(
                         stem_id = humidify(f"{stem_form}-{stem_gloss}")
                         wordformstems.append(
                             {
-                                "ID": f"{stem_id}{w_id}",
                                 "Wordform_ID": w_id,
                                 "Stem_ID": stem_id,
                                 "Index": identify_complex_stem_position(
@@ -256,7 +384,7 @@ def build_slices(
                                 ),
                             }
                         )
-                        if stem_id not in found_stems:
+                        if stem_id not in found_stems and stem_id not in seen["stems"]:
                             found_stems[stem_id] = {
                                 "ID": stem_id,
                                 "Name": stem_form,
@@ -280,38 +408,69 @@ def build_slices(
                         for infl in wf_inflections:
                             infl["Stem_ID"] = stem_id
                             inflections.append(infl)
-            s_slices.append(
-                {
-                    "ID": f"{sentence['ID']}-{s_idx}",
-                    "Example_ID": sentence["ID"],
-                    "Wordform_ID": w_id,
-                    "Form": w_obj.replace("-", ""),
-                    "Segmentation": w_obj,
-                    "Gloss": w_gloss,
-                    "Parameter_ID": meaning_id,
-                    "Index": s_idx,
-                }
-            )
+            for key, value in [
+                ("Example_ID", ex_key),
+                ("Wordform_ID", w_key),
+                ("Form", shared(w_obj.replace("-", ""))),
+                ("Segmentation", shared(w_obj)),
+                ("Gloss", shared(w_gloss)),
+                ("Parameter_ID", meaning_key),
+                ("Index", s_idx),
+            ]:
+                s_slices[key].append(value)
+    for table, registries in [
+        (s_slices, {"Example_ID": ex_keys, "Parameter_ID": meaning_keys}),
+        (w_slices, {"Morph_ID": morph_keys, "Form_Meaning": meaning_keys}),
+    ]:
+        registries["Wordform_ID"] = wf_keys
+        for col, registry in registries.items():
+            table[col] = _decode(table[col], registry)
+        table["Index"] = np.asarray(table["Index"])
     if not morphinder:
         w_slices = None
     else:
-        if morphinder.failed_cache:
-            log.warning("Could not find lexicon entries for the following morphs:")
-            for a, b in morphinder.failed_cache:
-                log.warning(f"{a} ‘{b}’")
-        w_slices = pd.DataFrame.from_dict(w_slices)
+        failed = [x for x in morphinder.failed_cache if x not in seen["failed"]]
+        for a, b in failed:
+            diagnostics.add(
+                "Could not find lexicon entries for these morphs", f"{a} ‘{b}’"
+            )
+        seen["failed"].update(failed)
+        w_slices = pd.DataFrame(w_slices)
+    s_slices = pd.DataFrame(s_slices)
+    if low_memory:
+        s_slices = helpers.compact_frame(s_slices)
+    wordformstems = pd.DataFrame.from_dict(wordformstems)
+    seen["wordforms"].update(wfs)
+    seen["meanings"].update(w_meanings)
+    seen["stems"].update(found_stems)
+    if own_diagnostics:
+        diagnostics.write(log)
+    if ids:
+        s_slices, w_slices, wordformstems = materialize_ids(
+            s_slices, w_slices, wordformstems
+        )
     return (
         pd.DataFrame.from_dict(wfs.values()),
         pd.DataFrame.from_dict(w_meanings.values()),
-        pd.DataFrame.from_dict(s_slices),
+        s_slices,
         w_slices,
         pd.DataFrame.from_dict(inflections),
         pd.DataFrame.from_dict(found_stems.values()),
-        pd.DataFrame.from_dict(wordformstems),
+        wordformstems,
         pd.DataFrame.from_dict(stem_parts),
     )
 
 
+@lru_cache(maxsize=None)
+def get_tokenizer(segments):
+    """Create a tokenizer from an orthography profile (cached, so batch jobs can share it)."""
+    extra = ["+", "-", "(", ")", "/", "∅", "0", "?", ",", "=", ";"]
+    pdf = load(segments)
+    return Tokenizer(
+        Profile(*(pdf.to_dict("records") + [{"Grapheme": x, "IPA": x} for x in extra]))
+    )
+
+
 def guess_texts(strings, fn):
     groups = {}
     distances = []
@@ -352,6 +511,317 @@ def guess_texts(strings, fn):
     return groups
 
 
+def _iter_records(filename, separator, encoding, block_size=2**20):
+    """Yield the records of a file, like `content.split(separator)[1:]`,
+    without reading the whole file at once. Compressed files are decompressed
+    as a stream (see `helpers.open_text`)."""
+    with helpers.open_text(filename, "r", encoding=encoding) as f:
+        buffer = ""
+        started = False
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            buffer += block
+            *parts, buffer = buffer.split(separator)
+            for part in parts:
+                if started:
+                    yield part
+                started = True  # skip the file header
+        if started:
+            yield buffer
+
+
+def _encoding_error(conf):
+    log.error(
+        f"""Could not open the file with the encoding [{conf["encoding"]}].
+    Make sure that you are not parsing a shoebox project as toolbox or vice versa.
+    You can also explicitly set the correct file encoding in your config."""
+    )
+    sys.exit()
+
+
+def sample_records(filenames, conf, n_records, seed=None):
+    """Pick `n_records` random records of a corpus, without parsing it.
+
+    Returns a set of (file index, record index) positions for `_read_records`.
+    """
+    separator = "\\" + conf["record_marker"] + " "
+    try:
+        counts = [
+            sum(1 for _ in _iter_records(filename, separator, conf["encoding"]))
+            for filename in filenames
+        ]
+    except UnicodeDecodeError:
+        _encoding_error(conf)
+    total = sum(counts)
+    picks = random.Random(seed).sample(range(total), min(n_records, total))
+    offsets = np.cumsum([0] + counts)
+    file_idx = np.searchsorted(offsets, picks, side="right") - 1
+    return {(int(i), int(k - offsets[i])) for i, k in zip(file_idx, picks)}
+
+
+def _read_records(
+    filenames, conf, seen, duplicates, chunk_size=None, limit=None, selected=None
+):
+    """Parse corpus files, skipping empty and duplicate records.
+
+    Yields a filename and its records (`RecordColumns`) for every file,
+    or for every `chunk_size` records.
+    With `limit`, only the first `limit` records are kept; with `selected`, only
+    the records at these positions (see `sample_records`).
+    """
+    record_marker = "\\" + conf["record_marker"]
+    hash_content = conf.get("duplicate_check", "content") == "content"
+    n_records = 0
+    for file_idx, filename in enumerate(filenames):
+        if limit and n_records == limit:
+            break
+        recs = RecordColumns()
+        try:
+            for rec_idx, record in enumerate(
+                _iter_records(filename, record_marker + " ", conf["encoding"])
+            ):
+                if limit and n_records == limit:
+                    break
+                if selected is not None and (file_idx, rec_idx) not in selected:
+                    continue
+                res = _get_fields(
+                    record_marker + " " + record,
+                    record_marker,
+                    multiple=[],
+                    sep=conf["cell_separator"],
+                )
+                if not res:
+                    continue
+                dupe = _check_duplicate(
+                    res, record_marker, seen, filename, hash_content
+                )
+                if dupe:  # only keep the first record with a given ID
+                    duplicates.append(dupe)
+                    continue
+                recs.append(res)
+                n_records += 1
+                if chunk_size and len(recs) == chunk_size:
+                    yield filename, recs
+                    recs = RecordColumns()
+        except UnicodeDecodeError:
+            _encoding_error(conf)
+        if len(recs) > 0 or not chunk_size:
+            yield filename, recs
+
+
+def _missing_fields(filename, separator, mappings, required, conf, n_records):
+    """Find the `required` columns whose fields are not in a file.
+
+    Only the first `n_records` records are parsed, missing fields are searched
+    for in the rest. Returns the missing columns with their markers, and the
+    parsed records.
+    """
+    marker = separator.strip(" ")
+    records = _iter_records(filename, separator, conf["encoding"])
+    first = [
+        _get_fields(marker + " " + x, marker, [], conf["cell_separator"])
+        for x in islice(records, n_records)
+    ]
+    first = [x for x in first if x]
+    found = set().union(*first)
+    missing = {}
+    for col in required:
+        markers = [x for x, y in mappings.items() if y == col]
+        if markers and not found.intersection(markers):
+            missing[col] = markers
+    patterns = {
+        col: re.compile("|".join(rf"^{re.escape(x)}(?: |$)" for x in markers), re.M)
+        for col, markers in missing.items()
+    }
+    if first and patterns:
+        for record in records:
+            for col, pattern in list(patterns.items()):
+                if pattern.search(record):
+                    del patterns[col], missing[col]
+            if not patterns:
+                break
+    return missing, first
+
+
+def check_config(filenames, conf, lexicon=None, n_records=20):
+    """Check a configuration against the first records of a corpus and lexicon.
+
+    This is fast, so that mistakes in `interlinear_mappings` or `lexicon_mappings`
+    are found before the corpus is parsed.
+    Problems which would stop the extraction raise a `ValueError`.
+    """
+    required = {
+        "interlinear_mappings": ["Primary_Text", "Analyzed_Word", "Gloss"],
+        "lexicon_mappings": ["Meaning", "Part_Of_Speech"],
+    }
+    mappings = {
+        "interlinear_mappings": conf["interlinear_mappings"],
+        "lexicon_mappings": {
+            "\\" + conf["entry_marker"]: "Headword",
+            **conf["lexicon_mappings"],
+        },
+    }
+    files = [
+        ("interlinear_mappings", "\\" + conf["record_marker"] + " ", x)
+        for x in filenames
+    ]
+    if isinstance(lexicon, (str, Path)):
+        files.append(("lexicon_mappings", "\\" + conf["entry_marker"], lexicon))
+    problems = [
+        f"Please define a marker for {col} in {key} in your conf."
+        for key in dict.fromkeys(x[0] for x in files)
+        for col in required[key]
+        if col not in mappings[key].values()
+    ]
+    for key, separator, filename in files:
+        marker = separator.strip(" ")
+        try:
+            missing, first = _missing_fields(
+                filename, separator, mappings[key], required[key], conf, n_records
+            )
+        except UnicodeDecodeError:
+            problems.append(
+                f"Could not read {filename} with the encoding [{conf['encoding']}]"
+            )
+            continue
+        if not first:
+            problems.append(f"Did not find any records with [{marker}] in {filename}")
+            continue
+        found = set().union(*first)
+        for col, markers in missing.items():
+            problems.append(
+                f"{col} is mapped to {markers}, but there is no such field in {filename}. The first records contain {sorted(found)}"
+            )
+        unmapped = sorted(found - set(mappings[key]) - {marker})
+        if unmapped:
+            log.info(f"Fields in {filename} without a mapping: {unmapped}")
+        if key == "interlinear_mappings" and not missing:
+            obj, gloss = (
+                [x for x, y in mappings[key].items() if y == col]
+                for col in ["Analyzed_Word", "Gloss"]
+            )
+            misaligned = [
+                rec.get(marker, "")
+                for rec in first
+                if len(_split_words(" ".join(rec.get(x, "") for x in obj)))
+                != len(_split_words(" ".join(rec.get(x, "") for x in gloss)))
+            ]
+            if misaligned:
+                log.warning(
+                    f"{len(misaligned)} of the first {len(first)} records in {filename} have different numbers of words in Analyzed_Word and Gloss: {misaligned}"
+                )
+    for problem in problems:
+        log.error(problem)
+    if problems:
+        raise ValueError(
+            "The configuration does not match the data:\n" + "\n".join(problems)
+        )
+
+
+def _report_duplicates(duplicates, output_dir, complain=False):
+    dupes = pd.DataFrame.from_dict(duplicates)
+    n_conflicts = len(dupes[dupes["Type"] == "conflict"])
+    log.warning(
+        f"Skipped {len(dupes)} records with duplicate IDs, {n_conflicts} of which differ from the first record."
+    )
+    if complain:
+        log.warning(f"Duplicate records:\n{dupes}")
+    if output_dir:
+        dupes.to_csv(Path(output_dir) / "duplicates.csv", index=False)
+
+
+def _load_text_map(fn, ids, conf, output_dir, all_texts):
+    """Load the texts of a corpus file and map its record IDs to text IDs.
+
+    If there is no record-text mapping yet, it is guessed from `ids`.
+    Returns the texts and the mapping.
+    """
+    stem = helpers.strip_compression(fn).stem
+    if conf["text_mode"] != "none":
+        text_path = output_dir / f"{stem}_texts.csv"
+        if text_path.is_file():
+            texts = load(text_path)
+        else:
+            texts = []
+    else:
+        texts = []
+    if conf["text_mode"] != "record_marker":
+        return texts, {}
+    tmap_file = output_dir / f"{stem}_textmap.yaml"
+    if tmap_file.is_file():
+        text_map = load(tmap_file)
+    elif ids is not None and len(ids) < 7000:
+        text_map = guess_texts(ids, fn)
+        dump(text_map, tmap_file)
+        log.info(f"Created tentative record-text mapping in {tmap_file.resolve()}")
+    else:
+        text_map = {}
+    if isinstance(texts, list):
+        texts.extend(text_map.keys())
+        texts = pd.DataFrame(texts)
+        if len(texts) > 0:
+            texts.columns = ["ID"]
+            for addcol in ["Name", "Description", "Comment", "Source", "Type"]:
+                texts[addcol] = ""
+            dump(texts, text_path)
+    reverse_map = {}
+    if text_map:
+        for text_id, recs in text_map.items():
+            for rec in recs:
+                reverse_map[rec] = text_id
+        all_texts.append(texts)
+    return texts, reverse_map
+
+
+def _aligned_tokens(*columns):
+    """Split aligned columns at whitespace and flatten them; as with `zip`,
+    tokens without a counterpart in all columns are dropped."""
+    tokens = [[helpers.WHITESPACE.split(x) for x in col] for col in columns]
+    lengths = [np.fromiter(map(len, x), dtype=np.int64, count=len(x)) for x in tokens]
+    n_aligned = np.minimum.reduce(lengths)
+    result = []
+    for col, length in zip(tokens, lengths):
+        offsets = np.repeat(np.cumsum(length) - length, length)
+        position = np.arange(length.sum()) - offsets
+        keep = position < np.repeat(n_aligned, length)
+        flat = np.fromiter(chain.from_iterable(col), dtype=object)
+        result.append(flat[keep])
+    return result
+
+
+def _collect_morphs(df, morphs):
+    """Add the morphs of a corpus to a morph inventory (without a lexicon).
+
+    Morphs are pairs of aligned objects and glosses; IDs are only created for
+    distinct pairs, in order of their first occurrence.
+    """
+    objs, glosses = _aligned_tokens(df["Analyzed_Word"], df["Gloss"])
+    obj_codes, _ = pd.factorize(objs)
+    gloss_codes, gloss_values = pd.factorize(glosses)
+    pairs = obj_codes.astype(np.int64) * len(gloss_values) + gloss_codes
+    first = np.sort(np.unique(pairs, return_index=True)[1])
+    for obj, gloss in zip(objs[first], glosses[first]):
+        if obj == "":
+            continue
+        morph_id = humidify(obj + "-" + gloss, key="pairs")
+        if morph_id not in morphs:
+            morphs[morph_id] = {
+                "ID": morph_id,
+                "Form": obj,
+                "Meaning": gloss.strip("-").strip("="),
+            }
+    return morphs
+
+
+def _without_ids(records, ids):
+    """Get the records (dicts) whose ID is not in `ids`, as a dataframe."""
+    ids = set(ids)
+    return pd.DataFrame.from_dict([x for x in records if x["ID"] not in ids])
+
+
+@run_scoped
 def extract_corpus(
     filenames=None,
     conf=None,
@@ -366,6 +836,21 @@ def extract_corpus(
     include=None,
     parsing=None,
     languages=None,
+    output_db=None,
+    low_memory=False,
+    chunk_size=None,
+    partition=None,
+    merge=False,
+    jobs=None,
+    stream_format=None,
+    stream_file=None,
+    checkpoint=False,
+    resume=False,
+    limit=None,
+    sample=None,
+    seed=None,
+    compression=None,
+    engine=None,
 ):
     """Extract text records from a corpus.
 
@@ -373,320 +858,568 @@ def extract_corpus(
         database_file (str): The path to the corpus database file.
         conf (dict): Configuration (see) todo: insert link
         cldf (bool, optional): Should a CLDF dataset be created? Defaults to `False`.
+        output_db (str, optional): Path to a SQLite database to write the tables to, instead of CSV files.
+        low_memory (bool, optional): Store repetitive columns as categoricals until the tables are written. Defaults to `False`.
+        chunk_size (int, optional): Process the corpus this many records at a time.
+            The large tables are kept on disk until they are written, and nothing is returned.
+        partition (str, optional): Split the CLDF dataset by `text` or by `filename` (see `unboxer.cldf.create_partitioned_cldf`).
+        merge (bool, optional): Also write the partitions as a single dataset.
+        jobs (int, optional): Number of processes writing partitions.
+        stream_format (str, optional): Also write the analyzed examples as `jsonl` or
+            `conllu` (see `unboxer.export`); with `chunk_size`, after every chunk.
+        stream_file (file object, optional): Where to stream to; defaults to stdout.
+        checkpoint (bool, optional): Save the state after each stage (see `unboxer.checkpoints`).
+        resume (bool, optional): Start after the last saved stage whose inputs are unchanged.
+        limit (int, optional): Only process the first `limit` records, e.g. to try out a configuration.
+        sample (int, optional): Only process this many random records.
+        seed (int, optional): Seed for picking the `sample`.
+        compression (str, optional): Compress the CSV tables with `gzip`, `bz2`, `xz` or `zstd`.
+        engine (str, optional): `pandas` or `polars` (see `unboxer.engines`).
+        context (unboxer.context.ExtractionContext, optional): The ID generators of the run;
+            by default, every call has its own (see `unboxer.context`).
     """
-    # Logging
-    log_filepath = output_dir / "errors.log"
-    hdlr = logging.FileHandler(log_filepath, mode="w")
-    formatter = logging.Formatter("%(levelname)s: %(message)s")
-    hdlr.setFormatter(formatter)
-    hdlr.setLevel(logging.WARNING)
-    log.addHandler(hdlr)
-    file_recs = {}
+    conf = copy.deepcopy(conf)  # mappings are changed during the run
+    output_dir = Path(output_dir)
+    engine = get_engine(engine)
     inflection = inflection or {}
     output_dir.mkdir(exist_ok=True, parents=True)
-    for filename in filenames:
-        database_file = Path(filename)
-        record_marker = "\\" + conf["record_marker"]
-        sep = conf["cell_separator"]
-
-        try:
-            with open(database_file, "r", encoding=conf["encoding"]) as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            log.error(
-                f"""Could not open the file with the encoding [{conf["encoding"]}].
-    Make sure that you are not parsing a shoebox project as toolbox or vice versa.
-    You can also explicitly set the correct file encoding in your config."""
-            )
-            sys.exit()
-        file_recs[filename] = []
-        records = content.split(record_marker + " ")
-        for record in records[1::]:
-            res = _get_fields(
-                record_marker + " " + record, record_marker, multiple=[], sep=sep
-            )
-            if res:
-                file_recs[filename].append(res)
-            else:
-                pass
-                # log.warning("Empty record:")
-                # log.warning(record)
-    dfs = {x: pd.DataFrame.from_dict(y) for x, y in file_recs.items()}
+    if compression == "zstd":  # rather than after parsing
+        helpers.load_zstandard()
+    check_config(filenames, conf, lexicon)
+    selected = None
+    if sample:
+        selected = sample_records(filenames, conf, sample, seed)
+        log.info(f"Processing a sample of {len(selected)} records")
+    checkpoints = None
+    if checkpoint or resume:
+        checkpoints = Checkpoints(output_dir, resume=resume)
+        analysis_key = stage_key(
+            filenames,
+            conf,
+            lexicon,
+            parsing,
+            include,
+            inflection,
+            skip_empty_obj,
+            low_memory,
+            chunk_size,
+            limit,
+            sorted(selected) if selected else None,
+        )
+    record_marker = "\\" + conf["record_marker"]
+    sep = conf["cell_separator"]
+    database_file = Path(filenames[-1])
+    if include:  # IDs of the records to export
+        include = set(load(include))
+    else:
+        include = None
+    seen_records = {}
+    duplicates = []
     all_texts = []
-    for fn, df in dfs.items():
-        log.info(f"Processing {fn}")
-        if conf["text_mode"] != "none":
-            text_path = output_dir / f"{fn.stem}_texts.csv"
-            if text_path.is_file():
-                texts = load(text_path)
-            else:
-                texts = []
-
-        if record_marker in df and conf.get("slugify", True):
-            if conf["interlinear_mappings"].get(record_marker, "") == "ID":
-                conf["interlinear_mappings"].pop(record_marker)
-            tqdm.pandas(desc="Creating record IDs")
-            df["ID"] = df[record_marker].progress_apply(
-                lambda x: humidify(x, "sentence_id", unique=True)
-            )
-        else:
-            df["ID"] = df.index
-        df["filename"] = fn.name
-
-        if conf["text_mode"] == "record_marker":
-            tmap_file = output_dir / f"{fn.stem}_textmap.yaml"
-            if tmap_file.is_file():
-                text_map = load(tmap_file)
-            elif "ID" in df.columns and len(df) < 7000:
-                text_map = guess_texts(list(df["ID"]), fn)
-                dump(text_map, tmap_file)
-                log.info(
-                    f"Created tentative record-text mapping in {tmap_file.resolve()}"
-                )
-            else:
-                text_map = {}
-            if isinstance(texts, list):
-                texts.extend(text_map.keys())
-                texts = pd.DataFrame(texts)
-                if len(texts) > 0:
-                    texts.columns = ["ID"]
-                    for addcol in ["Name", "Description", "Comment", "Source", "Type"]:
-                        texts[addcol] = ""
-                    dump(texts, text_path)
-            if text_map:
-                reverse_map = {}
-                for text_id, recs in text_map.items():
-                    for rec in recs:
-                        reverse_map[rec] = text_id
-                df["Text_ID"] = df["ID"].map(reverse_map).fillna("")
-                all_texts.append(texts)
-    df = pd.concat(dfs.values())
-    if not df[record_marker].is_unique:
-        if complain:
-            log.warning("Found duplicate IDs, will only keep first of each:")
-            dupes = df[df.duplicated(record_marker)]
-            print(dupes)
-        df.drop_duplicates(record_marker, inplace=True)
-    df.rename(columns=conf["interlinear_mappings"], inplace=True)
-    if "Analyzed_Word" not in df.columns:
-        raise ValueError("Did not find Analyzed_Word:", conf["interlinear_mappings"])
-    if conf["skip_empty_obj"]:
-        old = len(df)
-        df = df[df["Gloss"] != ""]
-        log.info(f"Dropped {old-len(df)} unparsed records.")
-    df.fillna("", inplace=True)
-    df = df[df["Primary_Text"] != ""]
+    text_maps = {}  # texts and record-text mapping per file
+    file_markers = {}
 
-    if lexicon:
-        lex_df = extract_lexicon(
-            lexicon, parsing=parsing, conf=conf, output_dir=output_dir
+    def record_ids(df, offset=0, ids=None):
+        """The IDs of parsed records: unique slugs of their record markers, or their
+        positions in the file. `ids` is a `Humidifier` to use instead of the run's."""
+        if record_marker not in df or not conf.get("slugify", True):
+            return df.index + offset
+        if conf["interlinear_mappings"].get(record_marker, "") == "ID":
+            conf["interlinear_mappings"].pop(record_marker, None)
+        make_id = ids.humidify if ids else humidify
+        tqdm.pandas(desc="Creating record IDs")
+        return df[record_marker].progress_apply(
+            lambda x: make_id(x, "sentence_id", unique=True)
         )
-        morphemes, morphs = extract_morphs(lex_df, sep)
-        morphinder = Morphinder(morphs, complain=complain)
-    else:
-        tdf = df.copy()
-        morphs = {}
-        for c in ["Analyzed_Word", "Gloss"]:
-            tdf[c] = df[c].apply(lambda x: re.sub(r"-\s+", "-INTERN", x))
-            tdf[c] = df[c].apply(lambda x: re.sub(r"\s+-", "INTERN-", x))
-            tdf[c] = df[c].apply(lambda x: re.split(r"\s+", x))
-        for rec in tdf.to_dict("records"):
-            for obj, gloss in zip(rec["Analyzed_Word"], rec["Gloss"]):
-                if obj == "":
-                    continue
-                morph_id = humidify(obj + "-" + gloss, key="pairs")
-                if morph_id not in morphs:
-                    morphs[morph_id] = {
-                        "ID": morph_id,
-                        "Form": obj,
-                        "Meaning": gloss.strip("-").strip("="),
-                    }
-        morphs = pd.DataFrame.from_dict(morphs.values())
-        morphinder = Morphinder(morphs, complain=complain)
-    (
-        wordforms,
-        form_meanings,
-        sentence_slices,
-        morph_slices,
-        inflections,
-        stems,
-        wordformstems,
-        stemparts,
-    ) = build_slices(df, morphinder, **inflection)
-    morph_meanings = {}
-    stem_meanings = {}
-    for meanings in tqdm(morphs["Meaning"], desc="Morphs"):
-        for meaning in meanings.split("; "):
-            morph_meanings.setdefault(
-                meaning, {"ID": humidify(meaning, key="meanings"), "Name": meaning}
-            )
 
-    if len(stems) > 0:
-        for stem_gloss in tqdm(stems["Meaning"], desc="Stems"):
-            stem_meanings.setdefault(
-                stem_gloss,
-                {
-                    "ID": humidify(stem_gloss, key="meanings"),
-                    "Name": stem_gloss,
-                },
+    def prepare(filename, recs, offset=0):
+        df = recs.to_frame()
+        if filename not in file_markers:
+            log.info(f"Processing {filename}")
+        file_markers.setdefault(filename, {}).update(dict.fromkeys(df.columns))
+        df["ID"] = record_ids(df, offset)
+        df["filename"] = filename.name
+        if filename not in text_maps:  # texts can only be guessed from all records
+            text_maps[filename] = _load_text_map(
+                filename,
+                None if chunk_size or limit or sample else list(df["ID"]),
+                conf,
+                output_dir,
+                all_texts,
             )
-    if include:
-        include = load(include)
-        rec_list = include
-    else:
-        rec_list = list(df["ID"])
-    df = df[df["ID"].isin(rec_list)]
-
-    if conf["text_mode"] != "none" and all_texts:
-        texts = pd.concat(all_texts)
-        texts = texts[texts["ID"].isin(list(df["Text_ID"]))]
-
-    sentence_slices = sentence_slices[sentence_slices["Example_ID"].isin(rec_list)]
-    for col in tqdm(df.columns, desc="Columns"):
-        if col in conf["aligned_fields"]:
-            df[col] = df[col].apply(_remove_spaces)
-    df = df.apply(helpers.fix_glosses, axis=1)
-    sentence_slices = sentence_slices[sentence_slices["Example_ID"].isin(rec_list)]
-    if conf["fix_clitics"]:
-        log.info("Fixing clitics")
-        for col in conf["aligned_fields"]:
-            df[col] = df[col].apply(_fix_clitics)
-    if "Primary_Text" in df.columns:
-        df["Primary_Text"] = df["Primary_Text"].apply(lambda x: re.sub(r"\s+", " ", x))
-
-    if len(wordforms) > 0:
-        wordforms = wordforms[wordforms["Form"] != ""]
-
-    for x in [df, wordforms, morphs]:
-        x["Language_ID"] = conf.get("lang_id", "undefined")
-    if lexicon:
-        morphemes["Language_ID"] = conf.get("lang_id", "undefined")
-    if not morphs["ID"].is_unique:
-        log.warning("Duplicate IDs in morph table, only keeping first instances:")
-        log.warning(morphs[morphs.duplicated(subset="ID", keep=False)])
-        morphs.drop_duplicates(subset="ID", inplace=True)
-    if output_dir:
-        df.to_csv(
-            (Path(output_dir) / database_file.name).with_suffix(".csv"), index=False
+        text_map = text_maps[filename][1]
+        if text_map:
+            df["Text_ID"] = df["ID"].map(text_map).fillna("")
+        if include is not None:  # all records get IDs, but only some are analyzed
+            df = df[df["ID"].isin(include)]
+        return df
+
+    def read_chunks():
+        records = _read_records(
+            filenames,
+            conf,
+            seen_records,
+            duplicates,
+            chunk_size=chunk_size,
+            limit=limit,
+            selected=selected,
         )
-        morphs.to_csv((Path(output_dir) / "morphs.csv"), index=False)
-        if lexicon:
-            morphemes.to_csv((Path(output_dir) / "morphemes.csv"), index=False)
-    if cldf:
-        tables = {"examples.csv": df}
-        tables["exampleparts.csv"] = sentence_slices
-        if lexicon:
-            morphemes["Name"] = morphemes["Headword"]
-            morphemes["Description"] = morphemes["Meaning"]
-            morphemes["Parameter_ID"] = morphemes["Meaning"].apply(
-                lambda x: [morph_meanings[y]["ID"] for y in x.split("; ")]
-            )
-        if inflection:
-            stems["Parameter_ID"] = stems["Meaning"].apply(
-                lambda x: [stem_meanings[x]["ID"]]
+        if chunk_size:
+            offsets = {}
+            for filename, recs in records:
+                offset = offsets.get(filename, 0)
+                offsets[filename] = offset + len(recs)
+                yield engine.clean(
+                    prepare(filename, recs, offset), conf, add_missing=True
+                )
+        else:
+            dfs = [prepare(filename, recs) for filename, recs in records]
+        if duplicates:
+            _report_duplicates(duplicates, output_dir, complain=complain)
+        if not chunk_size:
+            df = pd.concat(dfs)
+            del dfs
+            yield engine.clean(df, conf)
+
+    start = time.perf_counter()
+    timings = []
+
+    def timed(stage, func, *args):
+        tick = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            timings.append(
+                {
+                    "Stage": stage,
+                    "Start": round(tick - start, 4),
+                    "End": round(time.perf_counter() - start, 4),
+                }
             )
 
-        if audio:
-            tables["media.to_csv"] = pd.DataFrame.from_dict(
-                [
-                    {
-                        "ID": f.stem,
-                        "Media_Type": "audio/" + f.suffix.strip("."),
-                        "Download_URL": str(f),
-                    }
-                    for f in audio.iterdir()
-                ]
+    def load_lexicon():
+        if isinstance(lexicon, pd.DataFrame):  # already parsed by extract_lexicon
+            lex_df = lexicon
+        else:
+            lex_df = extract_lexicon(
+                lexicon, parsing=parsing, conf=conf, output_dir=output_dir
             )
+        morphemes, morphs = extract_morphs(lex_df, sep)
+        return lex_df, morphemes, morphs, Morphinder(morphs, complain=complain)
+
+    def load_morphs(df):
+        morphs = {}
+        if chunk_size:  # the inventory needs all records
+            ids = Humidifier()  # the IDs `prepare` creates, for `include`
+            offsets = {}
+            for filename, recs in _read_records(
+                filenames, conf, {}, [], chunk_size, limit, selected
+            ):
+                chunk = recs.to_frame()
+                offset = offsets.get(filename, 0)
+                offsets[filename] = offset + len(recs)
+                if include is not None:
+                    chunk = chunk[record_ids(chunk, offset, ids).isin(include)]
+                chunk = engine.clean(chunk, conf, add_missing=True)
+                morphs = _collect_morphs(chunk, morphs)
+        else:
+            morphs = _collect_morphs(df, morphs)
+        morphs = pd.DataFrame.from_dict(morphs.values())
+        return None, None, morphs, Morphinder(morphs, complain=complain)
+
+    # warnings of this run go to errors.log, repeated ones are collected
+    log_file = attach_log_file(log, output_dir / "errors.log")
+    diagnostics = Diagnostics()
+    spool_dir = None
+    if chunk_size:
+        spool_dir = Path(tempfile.mkdtemp(prefix=".chunks-", dir=output_dir))
+    analysis = None
+    if checkpoints and not stream_format:  # streaming happens during the analysis
+        analysis = checkpoints.load("analysis", analysis_key, spool_dir)
+    # stages which do not depend on the corpus run while it is parsed
+    pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="unboxer")
 
-        morphs["Name"] = morphs["Form"]
-        if segments:
-            extra = ["+", "-", "(", ")", "/", "∅", "0", "?", ",", "=", ";"]
-            pdf = load(segments)
-            tokenizer = Tokenizer(
-                Profile(
-                    *(
-                        pdf.to_dict("records")
-                        + [{"Grapheme": x, "IPA": x} for x in extra]
+    def submit(stage, func, *args):  # in the context of this run
+        return pool.submit(contextvars.copy_context().run, timed, stage, func, *args)
+
+    background = {}
+    if analysis is None and (isinstance(lexicon, pd.DataFrame) or lexicon):
+        background["lexicon"] = submit("lexicon", load_lexicon)
+    if cldf and languages:
+        background["languages"] = submit("languages", load_languages, languages)
+    if segments:
+        background["segments"] = submit("segments", get_tokenizer, segments)
+
+    # large tables are spooled in chunked mode, the others stay in memory
+    examples, wordforms, sentence_slices, morph_slices = (
+        ChunkedTable(name, spool_dir)
+        for name in ["examples", "wordforms", "exampleparts", "wordformparts"]
+    )
+    form_meanings, inflections, stems, wordformstems, stemparts = (
+        ChunkedTable(name)
+        for name in ["meanings", "inflections", "stems", "wordformstems", "stemparts"]
+    )
+    seen = {}  # wordforms, meanings and stems found in earlier chunks
+    stream = WRITERS[stream_format](stream_file) if stream_format else None
+    used_morphs = set()
+    text_ids = set()
+    morphinder = None
+    try:
+        if analysis is None:
+            tick = time.perf_counter()
+            for df in read_chunks():
+                if low_memory:
+                    df = helpers.compact_frame(
+                        df, exclude=conf["aligned_fields"] + ["Primary_Text"]
                     )
-                )
-            )
-            log.info("Tokenizing...")
-            tokenize = lambda x: tokenizer(x.lower().replace("-", ""), column="IPA")
-            for label, m_df in {"wordforms": wordforms, "morphs": morphs}.items():
-                if len(m_df) > 0:
-                    for orig, repl in conf.get("replace", {}).items():
-                        m_df["Form"] = m_df["Form"].replace(orig, repl, regex=True)
-                    m_df["Segments"] = m_df["Form"].apply(
-                        lambda x: tokenize(x).split(" ")
+                if morphinder is None:
+                    timings.append(
+                        {
+                            "Stage": "first chunk" if chunk_size else "corpus",
+                            "Start": round(tick - start, 4),
+                            "End": round(time.perf_counter() - start, 4),
+                        }
                     )
-                    bad = m_df[m_df["Segments"].apply(lambda x: "�" in x)]
-                    if len(bad) > 1:
-                        log.warning(f"Unsegmentable {label}:\n{bad}\n")
-                        m_df["Segments"] = m_df["Segments"].apply(
-                            lambda x: "" if "�" in x else x
+                    if "lexicon" in background:
+                        lex_df, morphemes, morphs, morphinder = timed(
+                            "waiting for lexicon", background["lexicon"].result
+                        )
+                    else:
+                        lex_df, morphemes, morphs, morphinder = timed(
+                            "morph inventory", load_morphs, df
                         )
-        if len(morph_slices) > 0:
-            morph_slices["Gloss_ID"] = morph_slices["Gloss"].apply(id_glosses)
-            tables["glosses.csv"] = pd.DataFrame.from_dict(
-                [{"ID": v, "Name": k} for k, v in get_values("glosses").items()]
+                (
+                    chunk_wordforms,
+                    chunk_form_meanings,
+                    chunk_sentence_slices,
+                    chunk_morph_slices,
+                    chunk_inflections,
+                    chunk_stems,
+                    chunk_wordformstems,
+                    chunk_stemparts,
+                ) = build_slices(
+                    df,
+                    morphinder,
+                    low_memory=low_memory,
+                    ids=False,
+                    seen=seen,
+                    diagnostics=diagnostics,
+                    **inflection,
+                )
+                if low_memory:
+                    chunk_wordforms, chunk_morph_slices = (
+                        helpers.compact_frame(x)
+                        for x in [chunk_wordforms, chunk_morph_slices]
+                    )
+                if include is not None:
+                    for table in [chunk_morph_slices, chunk_stemparts]:
+                        if "Morph_ID" in table.columns:
+                            used_morphs.update(table["Morph_ID"])
+                if "Text_ID" in df.columns:
+                    text_ids.update(df["Text_ID"])
+                log.info("Normalizing aligned fields")
+                df = engine.normalize(
+                    df, conf["aligned_fields"], clitics=conf["fix_clitics"]
+                )
+                if len(chunk_wordforms) > 0:
+                    chunk_wordforms = chunk_wordforms[chunk_wordforms["Form"] != ""]
+                for x in [df, chunk_wordforms]:
+                    x["Language_ID"] = conf.get("lang_id", "undefined")
+                # IDs and plain strings for writing
+                (
+                    chunk_sentence_slices,
+                    chunk_morph_slices,
+                    chunk_wordformstems,
+                ) = materialize_ids(
+                    chunk_sentence_slices, chunk_morph_slices, chunk_wordformstems
+                )
+                if stream:
+                    stream.write(
+                        helpers.expand_frame(df),
+                        chunk_sentence_slices,
+                        helpers.expand_frame(chunk_morph_slices),
+                    )
+                for table, chunk in [
+                    (examples, df),
+                    (wordforms, chunk_wordforms),
+                    (sentence_slices, chunk_sentence_slices),
+                    (morph_slices, chunk_morph_slices),
+                    (form_meanings, chunk_form_meanings),
+                    (inflections, chunk_inflections),
+                    (stems, chunk_stems),
+                    (wordformstems, chunk_wordformstems),
+                    (stemparts, chunk_stemparts),
+                ]:
+                    table.append(chunk)
+                del df
+            if morphinder is None:
+                raise ValueError("Did not find any records in", filenames)
+            for future in background.values():
+                future.result()
+            log.info(
+                "Stage timings (seconds since start):\n"
+                + pd.DataFrame(timings).to_string(index=False)
             )
-        morphs["Description"] = morphs["Meaning"]
-        morphs["Parameter_ID"] = morphs["Description"].apply(
-            lambda x: [morph_meanings[y]["ID"] for y in x.split("; ")]
+            if chunk_size:  # same column order as with a single chunk
+                order = {}
+                for filename, markers in file_markers.items():
+                    extra = ["ID", "filename"]
+                    if text_maps[filename][1]:
+                        extra.append("Text_ID")
+                    order.update(dict.fromkeys(list(markers) + extra))
+                order = [conf["interlinear_mappings"].get(x, x) for x in order]
+                examples.columns.sort(
+                    key=lambda x: order.index(x) if x in order else len(order)
+                )
+            if checkpoints:
+                checkpoints.save(
+                    "analysis",
+                    analysis_key,
+                    {
+                        "examples": examples,
+                        "wordforms": wordforms,
+                        "sentence_slices": sentence_slices,
+                        "morph_slices": morph_slices,
+                        "form_meanings": form_meanings,
+                        "inflections": inflections,
+                        "stems": stems,
+                        "wordformstems": wordformstems,
+                        "stemparts": stemparts,
+                        "lex_df": lex_df,
+                        "morphemes": morphemes,
+                        "morphs": morphs,
+                        "text_maps": text_maps,
+                        "all_texts": all_texts,
+                        "text_ids": text_ids,
+                        "used_morphs": used_morphs,
+                        "conf": conf,
+                        "diagnostics": diagnostics.entries,
+                    },
+                )
+        else:
+            conf.update(analysis.pop("conf"))
+            diagnostics.entries = analysis.pop("diagnostics")
+            (  # in the order they were saved
+                examples,
+                wordforms,
+                sentence_slices,
+                morph_slices,
+                form_meanings,
+                inflections,
+                stems,
+                wordformstems,
+                stemparts,
+                lex_df,
+                morphemes,
+                morphs,
+                text_maps,
+                all_texts,
+                text_ids,
+                used_morphs,
+            ) = analysis.values()
+        form_meanings, inflections, stems, wordformstems, stemparts = (
+            x.to_frame()
+            for x in [form_meanings, inflections, stems, wordformstems, stemparts]
         )
-        if len(form_meanings) > 0:
-            morph_meanings = pd.DataFrame.from_dict(
-                [
-                    x
-                    for x in morph_meanings.values()
-                    if x["ID"] not in list(form_meanings["ID"])
-                ]
-            )
-            stem_meanings = pd.DataFrame.from_dict(
-                [
-                    x
-                    for x in stem_meanings.values()
-                    if x["ID"] not in list(form_meanings["ID"])
-                ]
+        if include is not None:  # only keep morphs used in the included records
+            if len(examples) == 0:
+                log.warning("None of the records to include were found")
+            morphs = morphs[morphs["ID"].isin(used_morphs)].copy()
+            if lex_df is not None:
+                lex_df = lex_df[lex_df["ID"].isin(morphs["Morpheme_ID"])]
+                morphemes = morphemes[morphemes["ID"].isin(lex_df["ID"])].copy()
+        morph_meanings = {}
+        stem_meanings = {}
+        for meanings in tqdm(morphs["Meaning"], desc="Morphs"):
+            for meaning in meanings.split("; "):
+                morph_meanings.setdefault(
+                    meaning, {"ID": humidify(meaning, key="meanings"), "Name": meaning}
+                )
+
+        if len(stems) > 0:
+            for stem_gloss in tqdm(stems["Meaning"], desc="Stems"):
+                stem_meanings.setdefault(
+                    stem_gloss,
+                    {
+                        "ID": humidify(stem_gloss, key="meanings"),
+                        "Name": stem_gloss,
+                    },
+                )
+
+        if text_maps:
+            texts = list(text_maps.values())[-1][0]
+        if conf["text_mode"] != "none" and all_texts:
+            texts = pd.concat(all_texts)
+            texts = texts[texts["ID"].isin(text_ids)]
+
+        morphs["Language_ID"] = conf.get("lang_id", "undefined")
+        if lex_df is not None:
+            morphemes["Language_ID"] = conf.get("lang_id", "undefined")
+        if not morphs["ID"].is_unique:
+            log.warning("Duplicate IDs in morph table, only keeping first instances:")
+            log.warning(morphs[morphs.duplicated(subset="ID", keep=False)])
+            morphs.drop_duplicates(subset="ID", inplace=True)
+        if output_dir and not output_db:
+            examples.to_csv(
+                helpers.table_path(
+                    output_dir,
+                    helpers.strip_compression(database_file).stem + ".csv",
+                    compression,
+                ),
+                index=False,
             )
-            tables["parameters.csv"] = pd.concat(
-                [form_meanings, morph_meanings, stem_meanings]
+            morphs.to_csv(
+                helpers.table_path(output_dir, "morphs.csv", compression), index=False
             )
-        else:
-            morph_meanings = pd.DataFrame.from_dict(morph_meanings.values())
-            tables["parameters.csv"] = morph_meanings
-        if len(wordforms) > 0:
-            tables["wordforms.csv"] = wordforms
-        tables["morphs.csv"] = morphs
-        tables["wordformparts.csv"] = morph_slices
-        if len(stems) > 0:
-            stems["Language_ID"] = conf.get("lang_id", "undefined")
-            stems["Lexeme_ID"] = stems["ID"]
-            tables["stems.csv"] = stems
-            tables["lexemes.csv"] = stems
-            tables["stemparts.csv"] = stemparts
-            tables["wordformstems.csv"] = wordformstems
-            tables["inflections.csv"] = inflections
-            tables["inflectionalcategories.csv"] = inflection["infl_cats"]
-            tables["inflectionalvalues.csv"] = inflection["infl_vals"]
-        if conf["text_mode"] != "none" and len(texts) > 0 and len(df) > 0:
-            tables["texts.csv"] = texts
-        if lexicon:
-            lexicon, meanings = get_lexical_data(lex_df)
-            tables["morphemes.csv"] = morphemes
-            tables["parameters.csv"] = pd.concat([meanings, tables["parameters.csv"]])
-            tables["parameters.csv"].drop_duplicates(subset="ID", inplace=True)
-        create_cldf(
-            tables=tables,
-            conf=conf,
-            output_dir=output_dir,
-            cldf_name=conf.get("cldf_name", "cldf"),
-            languages=languages,
-            module="corpus",
-        )
-    return df
+            if lex_df is not None:
+                morphemes.to_csv(
+                    helpers.table_path(output_dir, "morphemes.csv", compression),
+                    index=False,
+                )
+        if cldf or output_db:
+            tables = None
+            if checkpoints:
+                tables_key = stage_key(analysis_key, segments, audio)
+                tables = checkpoints.load("tables", tables_key, spool_dir)
+            if tables is None:
+                tables = {"examples.csv": examples}
+                tables["exampleparts.csv"] = sentence_slices
+                if lex_df is not None:
+                    morphemes["Name"] = morphemes["Headword"]
+                    morphemes["Description"] = morphemes["Meaning"]
+                    morphemes["Parameter_ID"] = morphemes["Meaning"].apply(
+                        lambda x: [morph_meanings[y]["ID"] for y in x.split("; ")]
+                    )
+                if inflection:
+                    stems["Parameter_ID"] = stems["Meaning"].apply(
+                        lambda x: [stem_meanings[x]["ID"]]
+                    )
+
+                if audio:
+                    tables["media.to_csv"] = pd.DataFrame.from_dict(
+                        [
+                            {
+                                "ID": f.stem,
+                                "Media_Type": "audio/" + f.suffix.strip("."),
+                                "Download_URL": str(f),
+                            }
+                            for f in audio.iterdir()
+                        ]
+                    )
+
+                morphs["Name"] = morphs["Form"]
+                if segments:
+                    tokenizer = get_tokenizer(segments)
+                    log.info("Tokenizing...")
+                    replace = helpers.Replacer(conf.get("replace"))
 
+                    @lru_cache(maxsize=None)
+                    def segment(form):
+                        form = form.lower().replace("-", "")
+                        return tokenizer(form, column="IPA").split(" ")
 
+                    def add_segments(m_df, label):
+                        m_df["Form"] = replace.apply(m_df["Form"])
+                        m_df["Segments"] = m_df["Form"].apply(segment)
+                        bad = m_df[m_df["Segments"].apply(lambda x: "�" in x)]
+                        if len(bad) > 1:
+                            log.warning(f"Unsegmentable {label}:\n{bad}\n")
+                            m_df["Segments"] = m_df["Segments"].apply(
+                                lambda x: "" if "�" in x else x
+                            )
+                        return m_df
+
+                    if len(wordforms) > 0:
+                        wordforms.update(lambda x: add_segments(x, "wordforms"))
+                    if len(morphs) > 0:
+                        morphs = add_segments(morphs, "morphs")
+                if len(morph_slices) > 0:
+                    morph_slices.update(
+                        lambda x: x.assign(Gloss_ID=x["Gloss"].apply(id_glosses))
+                    )
+                    tables["glosses.csv"] = pd.DataFrame.from_dict(
+                        [{"ID": v, "Name": k} for k, v in get_values("glosses").items()]
+                    )
+                morphs["Description"] = morphs["Meaning"]
+                morphs["Parameter_ID"] = morphs["Description"].apply(
+                    lambda x: [morph_meanings[y]["ID"] for y in x.split("; ")]
+                )
+                if len(form_meanings) > 0:
+                    morph_meanings = _without_ids(
+                        morph_meanings.values(), form_meanings["ID"]
+                    )
+                    stem_meanings = _without_ids(
+                        stem_meanings.values(), form_meanings["ID"]
+                    )
+                    tables["parameters.csv"] = pd.concat(
+                        [form_meanings, morph_meanings, stem_meanings]
+                    )
+                else:
+                    morph_meanings = pd.DataFrame.from_dict(morph_meanings.values())
+                    tables["parameters.csv"] = morph_meanings
+                if len(wordforms) > 0:
+                    tables["wordforms.csv"] = wordforms
+                tables["morphs.csv"] = morphs
+                tables["wordformparts.csv"] = morph_slices
+                if len(stems) > 0:
+                    stems["Language_ID"] = conf.get("lang_id", "undefined")
+                    stems["Lexeme_ID"] = stems["ID"]
+                    tables["stems.csv"] = stems
+                    tables["lexemes.csv"] = stems
+                    tables["stemparts.csv"] = stemparts
+                    tables["wordformstems.csv"] = wordformstems
+                    tables["inflections.csv"] = inflections
+                    tables["inflectionalcategories.csv"] = inflection["infl_cats"]
+                    tables["inflectionalvalues.csv"] = inflection["infl_vals"]
+                if conf["text_mode"] != "none" and len(texts) > 0 and len(examples) > 0:
+                    tables["texts.csv"] = texts
+                if lex_df is not None:
+                    lexicon, meanings = get_lexical_data(lex_df.copy())
+                    tables["morphemes.csv"] = morphemes
+                    tables["parameters.csv"] = pd.concat(
+                        [meanings, tables["parameters.csv"]]
+                    )
+                    tables["parameters.csv"].drop_duplicates(subset="ID", inplace=True)
+                if checkpoints:
+                    checkpoints.save("tables", tables_key, {"tables": tables})
+            else:
+                tables = tables["tables"]
+            if output_db:
+                write_sqlite(tables, output_db, sep=sep)
+            if cldf and partition:
+                create_partitioned_cldf(
+                    tables=tables,
+                    conf=conf,
+                    output_dir=output_dir,
+                    partition=partition,
+                    cldf_name=conf.get("cldf_name", "cldf"),
+                    languages=languages,
+                    jobs=jobs,
+                    merge=merge,
+                )
+            elif cldf:
+                create_cldf(
+                    tables=tables,
+                    conf=conf,
+                    output_dir=output_dir,
+                    cldf_name=conf.get("cldf_name", "cldf"),
+                    languages=languages,
+                    module="corpus",
+                )
+    finally:
+        for future in background.values():  # not started yet
+            future.cancel()
+        pool.shutdown(wait=True)
+        if spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+        diagnostics.write(log)
+        detach_log_file(log, log_file)
+    if chunk_size:
+        return None
+    return examples.to_frame()
+
+
+@run_scoped
 def extract_lexicon(
     database_file,
     conf,
@@ -696,21 +1429,26 @@ def extract_lexicon(
     audio=None,
     languages=None,
     examples=None,
+    output_db=None,
+    compression=None,
 ):
     hum = Humidifier()
 
     def humidify(*args, **kwargs):
         return hum.humidify(*args, **kwargs)
 
+    if compression == "zstd":
+        helpers.load_zstandard()
     database_file = Path(database_file)
+    conf = copy.deepcopy(conf)
     conf["lexicon_mappings"]["\\" + conf["entry_marker"]] = "Headword"
     entry_marker = "\\" + conf["entry_marker"]
-    with open(database_file, "r", encoding=conf["encoding"]) as f:
+    with helpers.open_text(database_file, "r", encoding=conf["encoding"]) as f:
         content = f.read()
     sep = conf["cell_separator"]
     lookup_dict = {}
     if parsing:
-        with open(parsing, "r", encoding=conf["encoding"]) as f:
+        with helpers.open_text(parsing, "r", encoding=conf["encoding"]) as f:
             parsing = f.read()
         parses = parsing.split("\n\n")
         for parse in parses[1::]:
@@ -764,13 +1502,32 @@ def extract_lexicon(
         sys.exit()
 
     if examples:
-        example_df = extract_corpus(examples, conf=conf)
+        # analyze the examples with the lexicon parsed above
+        if isinstance(examples, (str, Path)):
+            examples = [Path(examples)]
+        example_df = extract_corpus(
+            examples,
+            conf=conf,
+            lexicon=df,
+            output_dir=output_dir or ".",
+            output_db=output_db,
+            compression=compression,
+        )
     else:
         example_df = None
 
-    if output_dir:
+    if output_db:
+        if example_df is None:  # otherwise, the corpus tables include the lexicon
+            morphemes, morphs = extract_morphs(df, sep)
+            write_sqlite({"morphemes": morphemes, "morphs": morphs}, output_db, sep=sep)
+    elif output_dir:
         df.to_csv(
-            (Path(output_dir) / database_file.name).with_suffix(".csv"), index=False
+            helpers.table_path(
+                output_dir,
+                helpers.strip_compression(database_file).stem + ".csv",
+                compression,
+            ),
+            index=False,
         )
 
     if cldf == "wordlist":
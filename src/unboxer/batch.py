@@ -0,0 +1,181 @@
+"""Run extraction jobs for many projects, as listed in a manifest.
+
+A manifest is a yaml file like this:
+
+```yaml
+jobs: 4 # maximum number of concurrent jobs
+defaults: # values used for all projects
+  languages: languages.csv
+  cldf: true
+projects:
+  - name: pemon
+    files: [pemon/texts.txt]
+    conf: pemon/config.yaml
+    lexicon: pemon/lexicon.txt
+    segments: pemon/profile.csv
+  - name: pemon_dictionary
+    command: dictionary
+    files: pemon/lexicon.txt
+    conf: pemon/config.yaml
+```
+
+Relative paths are resolved against the manifest's directory.
+Output goes to `output` (default: `<name>`), and a timing summary is written to `batch_summary.csv`.
+"""
+import inspect
+import logging
+import multiprocessing
+import time
+from pathlib import Path
+
+import pandas as pd
+from writio import load
+
+from unboxer import extract_corpus, extract_lexicon
+from unboxer.context import ExtractionContext
+from unboxer.engines import process_context
+from unboxer.helpers import load_config, load_default_config, load_yaml
+
+log = logging.getLogger(__name__)
+
+PATH_KEYS = [
+    "files",
+    "conf",
+    "output",
+    "lexicon",
+    "parsing",
+    "segments",
+    "languages",
+    "include",
+    "audio",
+    "output_db",
+    "examples",
+    "inflection",
+]
+COMMANDS = ["corpus", "dictionary", "wordlist"]
+
+
+def _resolve(value, base):
+    if isinstance(value, list):
+        return [_resolve(x, base) for x in value]
+    if value is None:
+        return None
+    return base / value
+
+
+def load_manifest(path):
+    """Read a manifest and return the concurrency limit and a list of jobs."""
+    path = Path(path)
+    manifest = load_yaml(path)
+    base = path.parent
+    jobs = []
+    for project in manifest.get("projects", []):
+        job = {**manifest.get("defaults", {}), **project}
+        if "name" not in job:
+            raise ValueError(f"Project without a name in {path}: {project}")
+        job.setdefault("command", "corpus")
+        job.setdefault("output", job["name"])
+        if job["command"] not in COMMANDS:
+            raise ValueError(
+                f"Unknown command [{job['command']}] for project {job['name']}, use one of {COMMANDS}"
+            )
+        for key in PATH_KEYS:
+            if key in job:
+                job[key] = _resolve(job[key], base)
+        if not isinstance(job.get("files", []), list):
+            job["files"] = [job["files"]]
+        jobs.append(job)
+    return manifest.get("jobs"), jobs
+
+
+def _supported(func, kwargs, name):
+    params = inspect.signature(func).parameters
+    unknown = [k for k in kwargs if k not in params]
+    if unknown:
+        log.warning(f"Ignoring {unknown} for project {name}")
+    return {k: v for k, v in kwargs.items() if k in params}
+
+
+def run_job(job):
+    """Run a single job; returns a summary row."""
+    job = dict(job)
+    name = job.pop("name")
+    command = job.pop("command")
+    files = job.pop("files", [])
+    output_dir = job.pop("output")
+    data_format = job.pop("format", "toolbox")
+    config_file = job.pop("conf", None)
+    tick = time.perf_counter()
+    status, error = "done", ""
+    try:
+        with ExtractionContext().activate():  # shared by the files of a job
+            if config_file:
+                conf = load_config(config_file, data_format)
+            else:
+                conf = load_default_config(data_format)
+            output_dir.mkdir(exist_ok=True, parents=True)
+            if command == "corpus":
+                if job.get("inflection"):
+                    job["inflection"] = {
+                        k: load(x, index_col="ID")
+                        for k, x in zip(
+                            ["infl_cats", "infl_vals", "infl_morphemes"],
+                            job["inflection"],
+                        )
+                    }
+                extract_corpus(
+                    files,
+                    conf=conf,
+                    output_dir=output_dir,
+                    **_supported(extract_corpus, job, name),
+                )
+            else:
+                cldf = job.pop("cldf", False)
+                for filename in files:
+                    extract_lexicon(
+                        filename,
+                        conf=conf,
+                        output_dir=output_dir,
+                        cldf=command if cldf else None,
+                        **_supported(extract_lexicon, job, name),
+                    )
+    except (Exception, SystemExit) as e:  # pylint: disable=broad-exception-caught
+        status, error = "failed", repr(e)
+        log.error(f"Project {name} failed: {error}")
+    tock = time.perf_counter()
+    return {
+        "Project": name,
+        "Command": command,
+        "Status": status,
+        "Seconds": round(tock - tick, 4),
+        "Error": error,
+    }
+
+
+def run_batch(manifest, jobs=None, summary=None):
+    """Run all projects in a manifest in a pool of worker processes.
+
+    Every job has its own `unboxer.context.ExtractionContext`, so IDs are the same as in separate runs.
+    Languages files and orthography profiles are cached, so jobs running in the same
+    worker process share them.
+
+    Args:
+        manifest (str): Path to the manifest file.
+        jobs (int, optional): Maximum number of concurrent jobs; overrides the manifest.
+        summary (str, optional): Path of the timing summary; defaults to `batch_summary.csv` next to the manifest.
+    """
+    manifest = Path(manifest)
+    manifest_jobs, job_list = load_manifest(manifest)
+    jobs = jobs or manifest_jobs or multiprocessing.cpu_count()
+    tick = time.perf_counter()
+    log.info(f"Running {len(job_list)} projects with {jobs} workers")
+    with process_context().Pool(processes=jobs) as pool:
+        results = pool.map(run_job, job_list, chunksize=1)
+    tock = time.perf_counter()
+    results = pd.DataFrame.from_dict(results)
+    summary = Path(summary or manifest.parent / "batch_summary.csv")
+    results.to_csv(summary, index=False)
+    log.info(
+        f"Ran {len(job_list)} projects in {tock - tick:0.4f} seconds:\n{results.to_string()}"
+    )
+    return results
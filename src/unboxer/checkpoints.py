@@ -0,0 +1,120 @@
+"""Checkpoints of the stages of `extract_corpus`, for resuming failed runs.
+
+A run with checkpoints saves the state after each stage to `.checkpoints` in
+the output directory:
+
+* `analysis`: the parsed and normalized records, lexicon tables and slices
+* `tables`: the tokenized forms and assembled tables, before SQLite and CLDF output
+
+Every checkpoint is saved with a key derived from the inputs of its stage
+(files, configuration and arguments); the key of `tables` includes the one of
+`analysis`. With `--resume`, a run starts after the last stage whose key
+still matches.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+from unboxer.chunks import ChunkedTable
+from unboxer.context import current
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = ".checkpoints"
+FORMAT_VERSION = 1
+
+
+def _canonical(value):
+    # files are represented by their content, directories by their listing
+    if isinstance(value, (str, Path)) and Path(value).is_file():
+        digest = hashlib.sha256()
+        with open(value, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+        return ("file", digest.hexdigest())
+    if isinstance(value, Path) and value.is_dir():
+        return ("dir", sorted((p.name, p.stat().st_size) for p in value.iterdir()))
+    if isinstance(value, (list, tuple)):
+        return [_canonical(x) for x in value]
+    return value
+
+
+def stage_key(*values):
+    """Get a key for the inputs of a stage."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(
+        pickle.dumps([FORMAT_VERSION] + [_canonical(x) for x in values], protocol=4)
+    )
+    return digest.hexdigest()
+
+
+def _copy_tables(value, spool_dir):
+    if isinstance(value, ChunkedTable):
+        return value.copy(spool_dir)
+    if isinstance(value, dict):
+        return {k: _copy_tables(v, spool_dir) for k, v in value.items()}
+    return value
+
+
+class Checkpoints:
+    """Save and load the state of a run after its stages.
+
+    Args:
+        output_dir (pathlib.Path): The output directory of the run.
+        resume (bool): Load checkpoints; otherwise, they are only saved.
+    """
+
+    def __init__(self, output_dir, resume=False):
+        self.directory = Path(output_dir) / CHECKPOINT_DIR
+        self.resume = resume
+
+    def _path(self, stage):
+        return self.directory / f"{stage}.pkl"
+
+    def load(self, stage, key, spool_dir=None):
+        """Get the state saved after `stage`, or `None` if it does not match `key`.
+
+        The ID generators are restored as well. Spooled chunks are copied to
+        `spool_dir`, so the checkpoint stays intact.
+        """
+        path = self._path(stage)
+        if not self.resume or not path.is_file():
+            return None
+        try:
+            with open(path, "rb") as f:
+                if pickle.load(f) != key:
+                    log.info(f"The inputs of stage {stage} have changed")
+                    return None
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError) as e:
+            log.warning(f"Could not load checkpoint {path}: {e!r}")
+            return None
+        context = current()
+        for name in ["humidifier", "used_slugs", "slug_dict"]:
+            setattr(context, name, state.pop(name))
+        log.info(f"Resuming after stage {stage}")
+        return _copy_tables(state, spool_dir)
+
+    def save(self, stage, key, state):
+        """Save the state after `stage`, with the ID generators."""
+        path = self._path(stage)
+        stage_dir = self.directory / stage  # for spooled chunks
+        path.unlink(missing_ok=True)
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        stage_dir.mkdir(parents=True)
+        state = _copy_tables(state, stage_dir)
+        context = current()
+        state.update(
+            humidifier=context.humidifier,
+            used_slugs=context.used_slugs,
+            slug_dict=context.slug_dict,
+        )
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        log.info(f"Saved checkpoint after stage {stage}")
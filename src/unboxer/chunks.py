@@ -0,0 +1,158 @@
+"""Tables built chunk by chunk, for corpora which do not fit into memory."""
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+from unboxer.helpers import expand_frame
+
+
+class ChunkedTable:
+    """A table assembled from dataframes ("chunks") with the same kind of rows.
+
+    Chunks are kept in memory, or pickled to `spool_dir` if it is given.
+    They are read back one at a time by `chunks`, `records` and `to_csv`.
+    Categorical columns (see `helpers.compact_frame`) are kept as they are and
+    only turned into strings for writing, by `records`, `to_csv` and `to_frame`.
+    Empty chunks only contribute their columns; the first one is kept as a template.
+
+    Args:
+        name (str): Used for the spool file names.
+        spool_dir (pathlib.Path, optional): Directory for spooled chunks.
+    """
+
+    def __init__(self, name, spool_dir=None):
+        self.name = name
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self.columns = []
+        self._chunks = []
+        self._template = None
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, df):
+        """Add a chunk; new columns are added to the end of `columns`."""
+        if df is None:
+            return
+        self.columns.extend(col for col in df.columns if col not in self.columns)
+        if self._template is None:
+            self._template = df.iloc[:0]
+        if len(df) == 0:
+            return
+        self._length += len(df)
+        if self.spool_dir:
+            path = self.spool_dir / f"{self.name}-{len(self._chunks)}.pkl"
+            df.to_pickle(path)
+            self._chunks.append(path)
+        else:
+            self._chunks.append(df)
+
+    def _load(self, chunk):
+        if isinstance(chunk, Path):
+            return pd.read_pickle(chunk)
+        return chunk
+
+    def chunks(self):
+        """Yield the chunks with all columns (missing cells are empty strings).
+
+        An empty table yields one empty dataframe.
+        """
+        if not self._chunks:
+            template = self._template
+            if template is None:
+                template = pd.DataFrame(columns=self.columns)
+            yield template.reindex(columns=self.columns)
+        for chunk in self._chunks:
+            df = self._load(chunk)
+            if list(df.columns) != self.columns:
+                df = df.reindex(columns=self.columns, fill_value="")
+            yield df
+
+    def update(self, func):
+        """Replace every chunk `df` with `func(df)`."""
+        for i, chunk in enumerate(self._chunks):
+            df = func(self._load(chunk))
+            self.columns.extend(col for col in df.columns if col not in self.columns)
+            if isinstance(chunk, Path):
+                df.to_pickle(chunk)
+            else:
+                self._chunks[i] = df
+
+    def records(self, actions=()):
+        """Yield the rows as dicts; `actions` modify each chunk in place beforehand."""
+        for df in self.chunks():
+            df = expand_frame(df)
+            for action in actions:
+                action(df)
+            yield from df.to_dict("records")
+
+    def to_csv(self, path, **kwargs):
+        """Write all chunks to a CSV file, one after the other."""
+        header = True
+        for df in self.chunks():
+            expand_frame(df).to_csv(
+                path, mode="w" if header else "a", header=header, **kwargs
+            )
+            header = False
+
+    def copy(self, spool_dir=None):
+        """A copy of the table; spooled chunks are copied to `spool_dir`,
+        in-memory chunks are shared."""
+        table = ChunkedTable(self.name, spool_dir)
+        table.columns = list(self.columns)
+        table._template = self._template
+        table._length = self._length
+        for i, chunk in enumerate(self._chunks):
+            if isinstance(chunk, Path) and table.spool_dir:
+                path = table.spool_dir / f"{self.name}-{i}.pkl"
+                shutil.copyfile(chunk, path)
+                chunk = path
+            table._chunks.append(chunk)
+        return table
+
+    def to_frame(self):
+        frames = [expand_frame(df) for df in self.chunks()]
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index=True)
+
+
+class RecordColumns:
+    """Parsed records (dicts of fields), stored as one list per marker.
+
+    Markers are only stored once, as column names, in order of their first
+    appearance; records without a marker have `None` in its column. This is
+    the layout of `pd.DataFrame.from_dict` for the same records.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, record):
+        for marker, content in record.items():
+            column = self.columns.get(marker)
+            if column is None:
+                column = self.columns[marker] = [None] * self._length
+            column.append(content)
+        self._length += 1
+        if len(record) < len(self.columns):
+            for column in self.columns.values():
+                if len(column) < self._length:
+                    column.append(None)
+
+    def to_frame(self):
+        return pd.DataFrame(self.columns)
+
+
+def chunks(table):
+    """Iterate over the chunks of a table, which is a `ChunkedTable` or a dataframe."""
+    if isinstance(table, ChunkedTable):
+        yield from table.chunks()
+    else:
+        yield table
@@ -1,24 +1,42 @@
+import hashlib
+import json
 import logging
+import multiprocessing
+import os
+import shutil
 import sys
+import tempfile
 import time
+from functools import lru_cache
 from pathlib import Path
 
 import pandas as pd
 import pybtex
 from cldf_ldd import add_columns, add_keys
+from cldf_ldd import keys as ldd_keys
 from cldf_ldd.components import tables as ldd_tables
 from cldfbench import CLDFSpec
 from cldfbench.cldf import CLDFWriter
-from humidifier import humidify
+from humidifier import Humidifier
+from pycldf import Dataset
 from pycldf.dataset import MD_SUFFIX
 from pycldf.sources import Source
 from pycldf.util import metadata2markdown, pkg_path
 from writio import load
 
+from unboxer.chunks import ChunkedTable, chunks
+from unboxer.context import humidify
+from unboxer.engines import process_context
 from unboxer.helpers import _slugify
 
 log = logging.getLogger(__name__)
 
+# tables written per partition, all others are shared
+PARTITIONED_TABLES = ["examples.csv", "exampleparts.csv", "wordformparts.csv"]
+PARTITION_COLUMNS = {"text": "Text_ID", "filename": "filename"}
+# digests of the files in a dataset directory, to only replace changed files
+DIGEST_FILE = "digests.json"
+
 
 def _splitcol(
     df, col, sep="; "
@@ -26,8 +44,26 @@ def _splitcol(
     df[col] = df[col].apply(lambda x: x.split(sep))
 
 
+def _add_rows(writer, key, df, actions=()):
+    """Pass the rows of a table to the writer, after applying `actions` to it.
+    Chunked tables are only read when the dataset is written."""
+    if isinstance(df, ChunkedTable):
+        writer.objects[key] = df.records(actions)
+        return
+    for action in actions:
+        action(df)
+    writer.objects[key].extend(df.to_dict("records"))
+
+
 def create_dataset(
-    tables, spec, conf, output_dir, cldf_name="cldf", languages=None, **kwargs
+    tables,
+    spec,
+    conf,
+    output_dir,
+    cldf_name="cldf",
+    languages=None,
+    language=None,
+    **kwargs,
 ):
     with CLDFWriter(spec) as writer:
         # mapping e.g. "examples.csv" to e.g. "ExampleTable", to use add_component("ExampleTable") later
@@ -40,9 +76,9 @@ def create_dataset(
                 MD_SUFFIX, ""
             )  # "examples.csv": Example
 
-        tables["languages.csv"] = pd.DataFrame.from_dict(
-            [get_lg(conf["lang_id"], languages)]
-        )
+        if language is None:  # not already looked up by the caller
+            language = get_lg(conf["lang_id"], languages)
+        tables["languages.csv"] = pd.DataFrame.from_dict([language])
 
         # mapping columns to required table transformation workflows
         table_actions = {
@@ -68,10 +104,8 @@ def create_dataset(
         for table in ldd_tables:  # morphs.csv
             if table["url"] in tables and len(tables[table["url"]]) > 0:
                 writer.cldf.add_component(table)  # add json metadata for MorphTable
-                for rec in tables.pop(table["url"]).to_dict(
-                    "records"
-                ):  # remove processed cldf-ldd files, iterate rows
-                    writer.objects[table["url"]].append(rec)  # write row to CLDF
+                # remove processed cldf-ldd files, write rows to CLDF
+                _add_rows(writer, table["url"], tables.pop(table["url"]))
             if table["url"] == "texts.csv":
                 texts = True
 
@@ -104,11 +138,9 @@ def create_dataset(
                         additional_columns[colname].get("target_id", "ID"),
                     )
 
-            for col in df.columns:  # apply mapped methods to dataframe
-                if col in table_actions:  # Gloss
-                    table_actions[col](df)  # splitcol(df, "Gloss", sep=" ")
-            for rec in df.to_dict("records"):
-                writer.objects[key].append(rec)
+            # apply mapped methods to dataframe, e.g. splitcol(df, "Gloss", sep=" ")
+            actions = [table_actions[col] for col in df.columns if col in table_actions]
+            _add_rows(writer, key, df, actions)
 
         add_columns(writer.cldf)  # add cldf-ldd columns to native tables
         add_keys(writer.cldf)  # write cldf-ldd specific keys
@@ -124,47 +156,319 @@ def create_dataset(
     return ds
 
 
+def _file_digest(path, block_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_digests(directory):
+    path = directory / DIGEST_FILE
+    if path.is_file():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def _changed_files(staging, target):
+    """Compare the files written to `staging` with the digests stored in `target`.
+
+    Returns the new digests and the names of the files which differ.
+    """
+    digests = {
+        p.name: _file_digest(p) for p in sorted(staging.iterdir()) if p.is_file()
+    }
+    old = _load_digests(target)
+    changed = [
+        name
+        for name, digest in digests.items()
+        if old.get(name) != digest or not (target / name).is_file()
+    ]
+    return digests, changed
+
+
+def _sync_dataset(staging, target, digests, changed):
+    """Move changed files from `staging` to `target` and remove files of earlier runs."""
+    for name in changed:
+        os.replace(staging / name, target / name)
+    removed = []
+    for path in target.iterdir():
+        if path.is_file() and path.name not in digests and path.name != DIGEST_FILE:
+            path.unlink()
+            removed.append(path.name)
+    if changed or removed:
+        with open(target / DIGEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(digests, f, indent=4)
+    return removed
+
+
+class _StagingLog(logging.LoggerAdapter):
+    """Report paths in the staging directory as paths in the dataset directory."""
+
+    def __init__(self, logger, staging, target):
+        super().__init__(logger, {})
+        self.paths = str(staging), str(target)
+
+    def process(self, msg, kwargs):
+        return str(msg).replace(*self.paths), kwargs
+
+
 def create_cldf(tables, conf, module, output_dir, cldf_name="cldf", **kwargs):
+    """Create a CLDF dataset in `output_dir/cldf_name`.
+
+    The dataset is written to a staging directory first; only files which differ
+    from the last run (see `digests.json`) are replaced, and validation is skipped
+    if nothing changed.
+
+    Returns:
+        The names of the changed files.
+    """
     if "lang_id" not in conf:
         raise TypeError("Please specify a Language_ID in your configuration")
 
-    spec = CLDFSpec(
-        dir=output_dir / cldf_name, module="Generic", metadata_fname="metadata.json"
-    )
-    if module == "Dictionary":
-        spec = CLDFSpec(
-            dir=output_dir / cldf_name,
-            module="Dictionary",
-            metadata_fname="metadata.json",
+    target = Path(output_dir) / cldf_name
+    target.mkdir(exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=f".{cldf_name}-", dir=output_dir))
+    if module not in ["Dictionary", "Wordlist"]:
+        module = "Generic"
+    spec = CLDFSpec(dir=staging, module=module, metadata_fname="metadata.json")
+
+    try:
+        tick = time.perf_counter()
+        log.info("Creating CLDF dataset")
+        ds = create_dataset(
+            tables=tables,
+            conf=conf,
+            spec=spec,
+            output_dir=output_dir,
+            cldf_name=cldf_name,
+            **kwargs,
         )
-    elif module == "Wordlist":
-        spec = CLDFSpec(
-            dir=output_dir / cldf_name,
-            module="Wordlist",
-            metadata_fname="metadata.json",
+        readme = metadata2markdown(ds, ds.directory)
+        with open(ds.directory / "README.md", "w", encoding="utf-8") as f:
+            f.write(readme)
+        tock = time.perf_counter()
+        log.info(
+            f"Created dataset {target.resolve()}/{ds.filename} in {tock - tick:0.4f} seconds"
         )
 
-    tick = time.perf_counter()
-    log.info("Creating CLDF dataset")
-    ds = create_dataset(
+        digests, changed = _changed_files(staging, target)
+        if changed:
+            tick = time.perf_counter()
+            log.info("Validating...")
+            ds.validate(log=_StagingLog(log, staging, target))
+            tock = time.perf_counter()
+            log.info(f"Validated in {tock - tick:0.4f} seconds")
+        removed = _sync_dataset(staging, target, digests, changed)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    if changed or removed:
+        log.info(
+            f"Changed files in {target}: {', '.join(changed) or 'none'}"
+            + (f"; removed: {', '.join(removed)}" if removed else "")
+        )
+    else:
+        log.info(f"No changes in {target}, skipped validation")
+    return changed
+
+
+def partition_tables(tables, column):
+    """Split the example-level tables by the values of an example column.
+
+    Exampleparts follow their example, and wordform parts go to every partition
+    using the wordform; unused wordform parts stay with the shared tables.
+
+    Returns:
+        The shared tables and a dict mapping column values to partitioned tables.
+    """
+    examples = tables["examples.csv"]
+    spool_dir = getattr(examples, "spool_dir", None)
+    partitions = {}
+
+    def partition(value):
+        if value not in partitions:
+            i = len(partitions)
+            partitions[value] = {
+                url: ChunkedTable(f"part{i}-{url.split('.')[0]}", spool_dir)
+                for url in PARTITIONED_TABLES
+            }
+        return partitions[value]
+
+    example_keys = {}
+    for df in chunks(examples):
+        if len(df) == 0:
+            continue
+        if column not in df.columns:
+            raise ValueError(f"Cannot partition examples by [{column}], no such column")
+        keys = df[column].fillna("")
+        for value, part in df.groupby(keys, sort=False):
+            partition(value)["examples.csv"].append(part)
+        example_keys.update(zip(df["ID"], keys))
+
+    wordform_keys = {}
+    for df in chunks(tables.get("exampleparts.csv", pd.DataFrame())):
+        if len(df) == 0:
+            continue
+        keys = df["Example_ID"].map(example_keys)
+        for value, part in df.groupby(keys, sort=False):
+            partitions[value]["exampleparts.csv"].append(part)
+        for wordform, value in zip(df["Wordform_ID"], keys):
+            wf_keys = wordform_keys.setdefault(wordform, [])
+            if value not in wf_keys:
+                wf_keys.append(value)
+
+    shared = {k: v for k, v in tables.items() if k not in PARTITIONED_TABLES}
+    unused = ChunkedTable("shared-wordformparts", spool_dir)
+    for df in chunks(tables.get("wordformparts.csv", pd.DataFrame())):
+        if len(df) == 0:
+            continue
+        keys = df["Wordform_ID"].map(wordform_keys)
+        used = keys.notna()
+        unused.append(df[~used])
+        parts = df[used].assign(_key=keys[used]).explode("_key")
+        for value, part in parts.groupby("_key", sort=False):
+            partitions[value]["wordformparts.csv"].append(part.drop(columns="_key"))
+    if len(unused) > 0:
+        shared["wordformparts.csv"] = unused
+    return shared, partitions
+
+
+def _write_partition(args):
+    tables, conf, base_dir, name, language = args
+    create_cldf(
         tables=tables,
         conf=conf,
-        spec=spec,
-        output_dir=output_dir,
-        cldf_name=cldf_name,
-        **kwargs,
-    )
-    tock = time.perf_counter()
-    log.info(
-        f"Created dataset {ds.directory.resolve()}/{ds.filename} in {tock - tick:0.4f} seconds"
+        module="corpus",
+        output_dir=base_dir,
+        cldf_name=name,
+        language=language,
     )
 
+
+def create_partitioned_cldf(
+    tables,
+    conf,
+    output_dir,
+    partition,
+    cldf_name="cldf",
+    languages=None,
+    jobs=None,
+    merge=False,
+):
+    """Write a corpus as CLDF datasets partitioned by text or by source file.
+
+    `<cldf_name>/shared` contains the lexical tables, and there is a dataset with
+    examples, exampleparts and wordform parts for every partition, listed in
+    `<cldf_name>/partitions.csv`. The datasets are written in parallel.
+
+    Args:
+        partition (str): `text`, `filename` or the name of another example column.
+        jobs (int, optional): Number of worker processes (default: number of CPUs).
+        merge (bool, optional): Also assemble a single dataset in `<cldf_name>/merged`.
+    """
+    column = PARTITION_COLUMNS.get(partition, partition)
+    base_dir = Path(output_dir) / cldf_name
+    base_dir.mkdir(parents=True, exist_ok=True)
+    shared, partitions = partition_tables(tables, column)
+    names = Humidifier(["shared", "merged"])
+    index = pd.DataFrame(
+        [
+            {
+                "Partition": value,
+                "Directory": names.humidify(str(value) or "none"),
+                "Examples": len(part["examples.csv"]),
+            }
+            for value, part in partitions.items()
+        ],
+        columns=["Partition", "Directory", "Examples"],
+    )
+    index_file = base_dir / "partitions.csv"
+    if index_file.is_file():  # remove partitions of earlier runs
+        current = set(index["Directory"])
+        for directory in pd.read_csv(index_file, dtype=str)["Directory"]:
+            if directory not in current:
+                shutil.rmtree(base_dir / directory, ignore_errors=True)
+    # the language is only looked up once, not by every worker
+    language = get_lg(conf["lang_id"], languages) if "lang_id" in conf else None
+    tasks = [(shared, conf, base_dir, "shared", language)] + [
+        (part, conf, base_dir, directory, language)
+        for part, directory in zip(partitions.values(), index["Directory"])
+    ]
+    jobs = min(jobs or multiprocessing.cpu_count(), len(tasks))
     tick = time.perf_counter()
-    log.info("Validating...")
-    ds.validate(log=log)
+    log.info(f"Writing {len(partitions)} partitions by {column} with {jobs} workers")
+    if jobs > 1:
+        with process_context().Pool(processes=jobs) as pool:
+            pool.map(_write_partition, tasks, chunksize=1)
+    else:
+        for task in tasks:
+            _write_partition(task)
+    index.to_csv(index_file, index=False)
     tock = time.perf_counter()
-    log.info(f"Validated in {tock - tick:0.4f} seconds")
-
+    log.info(f"Wrote partitioned dataset {base_dir} in {tock - tick:0.4f} seconds")
+    if merge:
+        merge_partitions(base_dir)
+
+
+def _merged_rows(datasets, url):
+    seen = set()
+    for ds in datasets:
+        if ds.get(url) is None:
+            continue
+        for row in ds[url]:
+            if row["ID"] not in seen:
+                seen.add(row["ID"])
+                yield row
+
+
+def merge_partitions(directory, output=None):
+    """Assemble a partitioned dataset into a single CLDF dataset.
+
+    Args:
+        directory (str): The partitioned dataset, containing `partitions.csv`.
+        output (str, optional): Where to write the dataset (default: `merged` in `directory`).
+    """
+    directory = Path(directory)
+    output = Path(output) if output else directory / "merged"
+    index = pd.read_csv(directory / "partitions.csv", dtype=str, keep_default_na=False)
+    datasets = [
+        Dataset.from_metadata(directory / name / "metadata.json")
+        for name in ["shared"] + list(index["Directory"])
+    ]
+    tick = time.perf_counter()
+    log.info(f"Merging {len(index)} partitions")
+    if output.exists():
+        shutil.rmtree(output)
+    shutil.copytree(directory / "shared", output)
+    ds = Dataset.from_metadata(output / "metadata.json")
+    urls = []
+    for url in PARTITIONED_TABLES:
+        for part in datasets:
+            if part.get(url) is not None:
+                if ds.get(url) is None:
+                    ds.add_component(part[url].asdict(omit_defaults=True))
+                urls.append(url)
+                break
+    for (
+        src,
+        col,
+        goal,
+        goal_col,
+    ) in ldd_keys:  # keys between shared and partitioned tables
+        src_table, goal_table = ds.get(src), ds.get(goal)
+        if src_table is None or goal_table is None or ds.get((src, col)) is None:
+            continue
+        if not {src_table.url.string, goal_table.url.string} & set(urls):
+            continue
+        if any(col in fk.columnReference for fk in src_table.tableSchema.foreignKeys):
+            continue
+        ds.add_foreign_key(src, col, goal, goal_col)
+    ds.write(**{url: _merged_rows(datasets, url) for url in urls})
+    tock = time.perf_counter()
+    log.info(f"Merged dataset {output} in {tock - tick:0.4f} seconds")
+    ds.validate(log=log)
     readme = metadata2markdown(ds, ds.directory)
     with open(ds.directory / "README.md", "w", encoding="utf-8") as f:
         f.write(readme)
@@ -180,9 +484,25 @@ def _replace_meanings(label, meaning_dict):
     return [meaning_dict[x] for x in label.split("; ")]
 
 
+@lru_cache(maxsize=None)
+def load_languages(languages):
+    """Load a languages CSV file (cached, so batch jobs can share it)."""
+    return load(languages, mode="csv2dict")
+
+
+@lru_cache(maxsize=None)
+def load_glottolog():
+    import pyglottolog  # pylint: disable=import-outside-toplevel
+    from cldfbench.catalogs import (  # pylint: disable=import-outside-toplevel
+        Glottolog,
+    )
+
+    return pyglottolog.Glottolog(Glottolog.from_config().repo.working_dir)
+
+
 def get_lg(lg_id, languages=None):
     if languages is not None:
-        lgs = load(languages, mode="csv2dict")
+        lgs = load_languages(languages)
         if lg_id not in lgs:
             log.error(
                 f"The specified language ID [{lg_id}] was not found in the file {languages}"
@@ -190,16 +510,12 @@ def get_lg(lg_id, languages=None):
             sys.exit()
         return lgs[lg_id]
     try:
-        import pyglottolog  # pylint: disable=import-outside-toplevel
-        from cldfbench.catalogs import (
-            Glottolog,
-        )  # pylint: disable=import-outside-toplevel
+        glottolog = load_glottolog()
     except ImportError:
         log.error(
             "Use pip to install cldfbench[glottolog]. Alternatively, you can specify a languages.csv file."
         )
         sys.exit()
-    glottolog = pyglottolog.Glottolog(Glottolog.from_config().repo.working_dir)
     languoid = glottolog.languoid(lg_id)
     return {
         "ID": languoid.id,
@@ -217,7 +533,7 @@ def get_lexical_data(lexicon, drop_variants=False, sep="; "):
         meaning: _slugify(meaning, "meanings", ids=False) for meaning in meanings
     }
     meanings = [{"ID": y, "Name": x} for x, y in meaning_dict.items()]
-    meanings = pd.DataFrame.from_dict(meanings)
+    meanings = pd.DataFrame(meanings, columns=["ID", "Name"])
     meanings = meanings[meanings["Name"] != ""]
     lexicon["Parameter_ID"] = lexicon["Meaning"].apply(
         lambda x: _replace_meanings(x, meaning_dict)
@@ -240,6 +556,17 @@ def get_senses(lexicon):
     return senses
 
 
+def link_senses(senses, examples, sep=" ; "):
+    """Get the sense IDs referring to each example, via the senses' `Example_IDs`."""
+    links = senses[["ID", "Example_IDs"]].drop_duplicates("ID")
+    links = links.assign(Example_ID=links["Example_IDs"].str.split(sep)).explode(
+        "Example_ID"
+    )
+    links = links[links["Example_ID"].notna() & (links["Example_ID"] != "")]
+    sense_ids = links.groupby("Example_ID", sort=False)["ID"].agg(list)
+    return [x if isinstance(x, list) else [] for x in examples["ID"].map(sense_ids)]
+
+
 def create_dictionary_cldf(
     lexicon, conf, output_dir, languages=None, examples=None, **kwargs
 ):
@@ -250,24 +577,18 @@ def create_dictionary_cldf(
     if isinstance(examples, pd.DataFrame):
         tables["examples.csv"] = examples
         if "Example_IDs" in tables["senses.csv"].columns:
-            sense_ex_dict = dict(
-                zip(tables["senses.csv"]["ID"], tables["senses.csv"]["Example_IDs"])
-            )
-            ex_sense_dict = {}
-            for sense, exs in sense_ex_dict.items():
-                if exs:
-                    for exid in exs.split(" ; "):
-                        ex_sense_dict.setdefault(exid, [])
-                        ex_sense_dict[exid].append(sense)
-            examples["Sense_IDs"] = examples.apply(
-                lambda x: ex_sense_dict.get(x["ID"], []), axis=1
-            )
+            examples["Sense_IDs"] = link_senses(tables["senses.csv"], examples)
 
     if languages:
         tables["languages.csv"] = load(languages)
 
     create_cldf(
-        tables=tables, conf=conf, module="Dictionary", output_dir=output_dir, **kwargs
+        tables=tables,
+        conf=conf,
+        module="Dictionary",
+        output_dir=output_dir,
+        languages=languages,
+        **kwargs,
     )
 
 
@@ -278,4 +599,10 @@ def create_wordlist_cldf(
     tables = {"parameters.csv": meanings, "forms.csv": lexicon}
     if languages:
         tables["languages.csv"] = load(languages)
-    create_cldf(tables=tables, conf=conf, module="Wordlist", output_dir=output_dir)
+    create_cldf(
+        tables=tables,
+        conf=conf,
+        module="Wordlist",
+        output_dir=output_dir,
+        languages=languages,
+    )
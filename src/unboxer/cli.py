@@ -7,7 +7,9 @@ import click
 from writio import load
 
 from unboxer import extract_corpus, extract_lexicon
+from unboxer.batch import run_batch
 from unboxer.helpers import load_config, load_default_config
+from unboxer.server import run_server
 
 log = logging.getLogger(__name__)
 
@@ -76,18 +78,50 @@ class ConvertCommand(click.Command):
                     show_default=True,
                     help="A yaml file with a list of allowed entries.",
                 ),
+                click.core.Option(
+                    ("-D", "--output-db", "output_db"),
+                    type=click.Path(path_type=Path),
+                    default=None,
+                    show_default=True,
+                    help="Write tables to this SQLite database instead of CSV files.",
+                ),
+                click.core.Option(
+                    ("-z", "--compress", "compression"),
+                    type=click.Choice(["gzip", "bz2", "xz", "zstd"]),
+                    default=None,
+                    help="Compress the CSV tables in the output directory (not the CLDF dataset).",
+                ),
             ]
         )
 
 
+def _reject_unsupported(kwargs):
+    """Fail if shared options which the command does not use were given."""
+    given = [name for name, value in kwargs.items() if value]
+    if given:
+        params = click.get_current_context().command.params
+        options = [max(x.opts, key=len) for x in params if x.name in given]
+        raise click.UsageError(f"Not supported by this command: {', '.join(options)}")
+
+
 @click.argument(
     "filename",
     type=click.Path(exists=True, path_type=Path),
 )
 @main.command(cls=ConvertCommand)
 def wordlist(
-    filename, data_format, config_file, cldf, output_dir, audio, languages, segments
+    filename,
+    data_format,
+    config_file,
+    cldf,
+    output_dir,
+    audio,
+    languages,
+    output_db,
+    compression,
+    **kwargs,
 ):
+    _reject_unsupported(kwargs)
     if not output_dir.is_dir():
         output_dir.mkdir(exist_ok=True, parents=True)
     if config_file:
@@ -106,6 +140,8 @@ def wordlist(
         cldf="wordlist" if cldf else None,
         audio=audio,
         languages=languages,
+        output_db=output_db,
+        compression=compression,
     )
 
 
@@ -124,8 +160,19 @@ def wordlist(
 )
 @main.command(cls=ConvertCommand)
 def dictionary(
-    filename, data_format, config_file, cldf, output_dir, audio, languages, examples
+    filename,
+    data_format,
+    config_file,
+    cldf,
+    output_dir,
+    audio,
+    languages,
+    examples,
+    output_db,
+    compression,
+    **kwargs,
 ):
+    _reject_unsupported(kwargs)
     if not output_dir.is_dir():
         output_dir.mkdir(exist_ok=True, parents=True)
     if config_file:
@@ -145,6 +192,8 @@ def dictionary(
         audio=audio,
         languages=languages,
         examples=examples,
+        output_db=output_db,
+        compression=compression,
     )
 
 
@@ -180,6 +229,98 @@ def dictionary(
     nargs=3,
     help="1. A CSV table of inflection categories.\n2. A CSV table of inflection values.\n3. A .yaml file with a dict mapping morph IDs to inflectional values",
 )
+@click.option(
+    "-M",
+    "--low-memory",
+    "low_memory",
+    default=False,
+    is_flag=True,
+    help="Store repetitive columns as categoricals (for large corpora)",
+)
+@click.option(
+    "-C",
+    "--chunk-size",
+    "chunk_size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Process this many records at a time, keeping large tables on disk (for corpora which do not fit into memory)",
+)
+@click.option(
+    "--partition",
+    "partition",
+    type=click.Choice(["text", "filename"]),
+    default=None,
+    help="Write the CLDF examples in one dataset per text or per source file, next to a shared dataset",
+)
+@click.option(
+    "--merge",
+    "merge",
+    is_flag=True,
+    help="Also assemble the partitions into a single CLDF dataset",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of processes writing partitions (default: number of CPUs)",
+)
+@click.option(
+    "--to",
+    "stream_format",
+    type=click.Choice(["jsonl", "conllu"]),
+    default=None,
+    help="Also write the analyzed examples as JSON Lines or CoNLL-U-style blocks; with --chunk-size, every chunk is written as soon as it is analyzed",
+)
+@click.option(
+    "--to-file",
+    "stream_file",
+    type=click.File("w", encoding="utf-8"),
+    default="-",
+    show_default=True,
+    help="Where to stream to (-: standard output)",
+)
+@click.option(
+    "--checkpoint",
+    "checkpoint",
+    is_flag=True,
+    help="Save the state after each stage to .checkpoints in the output directory",
+)
+@click.option(
+    "--resume",
+    "resume",
+    is_flag=True,
+    help="Start after the last checkpoint whose inputs and configuration are unchanged (implies --checkpoint)",
+)
+@click.option(
+    "--limit",
+    "limit",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Only process the first N records, e.g. to try out a configuration",
+)
+@click.option(
+    "--sample",
+    "sample",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Only process N random records",
+)
+@click.option(
+    "--seed",
+    "seed",
+    type=int,
+    default=None,
+    help="Random seed for --sample",
+)
+@click.option(
+    "--engine",
+    "engine",
+    type=click.Choice(["pandas", "polars"]),
+    default=None,
+    help="DataFrame engine for cleaning and normalizing records (default: pandas; polars needs to be installed)",
+)
 @main.command(cls=ConvertCommand)
 def corpus(filenames, data_format, config_file, cldf, inflection, **kwargs):
     if config_file:
@@ -198,5 +339,65 @@ def corpus(filenames, data_format, config_file, cldf, inflection, **kwargs):
     extract_corpus(filenames, conf=conf, cldf=cldf, inflection=infl_dict, **kwargs)
 
 
+@main.command()
+@click.argument(
+    "manifest",
+    type=click.Path(exists=True, path_type=Path),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    type=int,
+    default=None,
+    help="Maximum number of concurrent jobs (default: from manifest, or number of CPUs)",
+)
+@click.option(
+    "--summary",
+    "summary",
+    type=click.Path(path_type=Path),
+    default=None,
+    help="Where to write the timing summary (default: batch_summary.csv next to the manifest)",
+)
+def batch(manifest, jobs, summary):
+    """Run the projects listed in a manifest file."""
+    run_batch(manifest, jobs=jobs, summary=summary)
+
+
+@main.command()
+@click.argument(
+    "directory",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-H",
+    "--host",
+    "host",
+    default="127.0.0.1",
+    show_default=True,
+    help="Address to listen on",
+)
+@click.option(
+    "-P",
+    "--port",
+    "port",
+    type=click.IntRange(min=0),
+    default=8000,
+    show_default=True,
+    help="Port to listen on (0: any free port)",
+)
+@click.option(
+    "--cache-size",
+    "cache_size",
+    type=click.IntRange(min=0),
+    default=1024,
+    show_default=True,
+    help="Number of lookup results kept in memory",
+)
+def serve(directory, host, port, cache_size):
+    """Look up the morphs, morphemes and wordforms extracted to a directory over HTTP."""
+    run_server(directory, host=host, port=port, cache_size=cache_size)
+
+
 if __name__ == "__main__":
     sys.exit(main())  # pragma: no cover
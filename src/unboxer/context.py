@@ -0,0 +1,106 @@
+"""The state of an extraction run, so that runs in one process do not share IDs.
+
+IDs are created by `humidify` (record, wordform, morph and meaning IDs) and
+`slugify` (lexicon meanings), which remember the IDs they gave out. Every
+`extract_corpus` and `extract_lexicon` call runs in an `ExtractionContext`
+holding this state, and only writes its own warnings to its `errors.log`.
+Calls in threads run in separate contexts; nested calls (e.g. the lexicon
+of a corpus) share the context of the outer one. The active context is kept
+in a context variable, so code running in a run finds it with `current`.
+"""
+import contextvars
+import functools
+import logging
+from contextlib import contextmanager
+
+from humidifier import Humidifier
+from slugify import slugify as _slugify
+
+_current = contextvars.ContextVar("unboxer_context", default=None)
+
+
+class ExtractionContext:
+    """ID generators of a run."""
+
+    def __init__(self):
+        self.humidifier = Humidifier()
+        self.used_slugs = {}
+        self.slug_dict = {}
+
+    def humidify(self, text, key="default", unique=False):
+        return self.humidifier.humidify(text, key, unique)
+
+    def get_values(self, key):
+        return self.humidifier.get_values(key)
+
+    def slugify(self, text, marker, ids=True):
+        """Get a unique slug for `text` among those for `marker`; with `ids=False`,
+        the same text always gets the same slug."""
+        used = self.used_slugs.setdefault(marker, [])
+        slugs = self.slug_dict.setdefault(marker, {})
+        if not ids and text in slugs:
+            return slugs[text]
+        first = _slugify(text)
+        if first == "":
+            first = "null"
+        if first not in used:
+            used.append(first)
+            slugs[text] = first
+            return first
+        i = 0
+        slug_cand = f"{first}-{i}"
+        while slug_cand in used:
+            i += 1
+            slug_cand = f"{first}-{i}"
+        used.append(slug_cand)
+        slugs[text] = slug_cand
+        return slug_cand
+
+    @contextmanager
+    def activate(self):
+        """Make this the current context within a `with` block."""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+_default = ExtractionContext()
+
+
+def current():
+    """The active context; outside of runs, a context shared by the process."""
+    return _current.get() or _default
+
+
+def humidify(text, key="default", unique=False):
+    return current().humidify(text, key, unique)
+
+
+def get_values(key):
+    return current().get_values(key)
+
+
+def run_scoped(func):
+    """Run a function in the `ExtractionContext` passed as `context`, the active
+    one (for nested calls) or a new one."""
+
+    @functools.wraps(func)
+    def wrapper(*args, context=None, **kwargs):
+        context = context or _current.get() or ExtractionContext()
+        with context.activate():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class ContextFilter(logging.Filter):
+    """Only let through messages logged while `context` is active."""
+
+    def __init__(self, context):
+        super().__init__()
+        self.context = context
+
+    def filter(self, record):
+        return current() is self.context
@@ -0,0 +1,61 @@
+"""Warnings collected during a run and written in bulk at the end."""
+import logging
+
+from unboxer.context import ContextFilter, current
+
+
+class Diagnostics:
+    """Counts warnings per category and message instead of logging every one.
+
+    Args:
+        max_contexts (int): Number of contexts (e.g. record IDs) kept per message.
+    """
+
+    def __init__(self, max_contexts=5):
+        self.max_contexts = max_contexts
+        self.entries = {}  # category: {message: [count, contexts]}
+
+    def __len__(self):
+        return sum(
+            count
+            for messages in self.entries.values()
+            for count, _ in messages.values()
+        )
+
+    def add(self, category, message, context=None):
+        entry = self.entries.setdefault(category, {}).setdefault(message, [0, []])
+        entry[0] += 1
+        if context is not None and len(entry[1]) < self.max_contexts:
+            entry[1].append(context)
+
+    def write(self, logger, level=logging.WARNING):
+        """Log one message per category, then start over."""
+        for category, messages in self.entries.items():
+            total = sum(count for count, _ in messages.values())
+            lines = [f"{category} ({total} in total, {len(messages)} distinct):"]
+            for message, (count, contexts) in messages.items():
+                line = f"  {message}"
+                if count > 1:
+                    line += f" ({count} times)"
+                if contexts:
+                    more = ", ..." if count > len(contexts) else ""
+                    line += f" in {', '.join(str(x) for x in contexts)}{more}"
+                lines.append(line)
+            logger.log(level, "\n".join(lines))
+        self.entries = {}
+
+
+def attach_log_file(logger, path, level=logging.WARNING):
+    """Write the messages of `logger` in the current run to a file; returns the
+    handler, for `detach_log_file`."""
+    handler = logging.FileHandler(path, mode="w", encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    handler.setLevel(level)
+    handler.addFilter(ContextFilter(current()))
+    logger.addHandler(handler)
+    return handler
+
+
+def detach_log_file(logger, handler):
+    logger.removeHandler(handler)
+    handler.close()
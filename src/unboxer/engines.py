@@ -0,0 +1,175 @@
+"""DataFrame engines for the tabular stages of `extract_corpus`.
+
+After parsing, the records are cleaned (mappings, missing columns, unparsed and
+empty records) and their aligned fields are normalized by an engine:
+
+* `pandas` (default)
+* `polars`: lazy, multi-threaded expressions; use `pip install polars`
+
+Slices, IDs and lexicon lookups are row-wise Python (`Morphinder`, `humidifier`)
+and stay in pandas, so the polars engine returns pandas dataframes, with the
+index of its input.
+"""
+import logging
+import multiprocessing
+import sys
+
+import pandas as pd
+
+from unboxer import helpers
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = "pandas"
+REQUIRED_COLUMNS = ["Analyzed_Word", "Gloss", "Primary_Text"]
+
+
+def _missing_columns(df, conf, add_missing):
+    # a chunk may lack fields which are present in others
+    if not add_missing:
+        return []
+    return [
+        col
+        for col in REQUIRED_COLUMNS
+        if col not in df.columns and col in conf["interlinear_mappings"].values()
+    ]
+
+
+class PandasEngine:
+    name = "pandas"
+
+    def clean(self, df, conf, add_missing=False):
+        """Rename the fields of parsed records and drop unparsed and empty ones."""
+        df.rename(columns=conf["interlinear_mappings"], inplace=True)
+        for col in _missing_columns(df, conf, add_missing):
+            df[col] = ""
+        if "Analyzed_Word" not in df.columns:
+            raise ValueError(
+                "Did not find Analyzed_Word:", conf["interlinear_mappings"]
+            )
+        if conf["skip_empty_obj"]:
+            old = len(df)
+            df = df[df["Gloss"] != ""]
+            log.info(f"Dropped {old-len(df)} unparsed records.")
+        df.fillna("", inplace=True)
+        return df[df["Primary_Text"] != ""]
+
+    def normalize(self, df, aligned_fields, clitics=True):
+        """See `helpers.normalize_frame`."""
+        return helpers.normalize_frame(df, aligned_fields, clitics=clitics)
+
+
+class PolarsEngine:
+    name = "polars"
+
+    def __init__(self):
+        try:
+            import polars  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            log.error("Use pip to install unboxer[polars] to use the polars engine.")
+            sys.exit()
+        self.pl = polars
+
+    def _from_pandas(self, df):
+        # via lists, which works without pyarrow and for any pandas dtype
+        return self.pl.DataFrame(
+            {
+                str(col): df[col].astype(object).where(df[col].notna(), None).tolist()
+                for col in df.columns
+            },
+            strict=False,
+        )
+
+    def _to_pandas(self, lf, index):
+        return pd.DataFrame(lf.collect().to_dict(as_series=False), index=index)
+
+    def clean(self, df, conf, add_missing=False):
+        """Rename the fields of parsed records and drop unparsed and empty ones."""
+        pl = self.pl
+        df = df.rename(columns=conf["interlinear_mappings"])
+        if "Analyzed_Word" not in df.columns and not _missing_columns(
+            df, conf, add_missing
+        ):
+            raise ValueError(
+                "Did not find Analyzed_Word:", conf["interlinear_mappings"]
+            )
+        lf = (
+            self._from_pandas(df)
+            .lazy()
+            .with_row_index("_position")
+            .with_columns(
+                [pl.lit("").alias(x) for x in _missing_columns(df, conf, add_missing)]
+            )
+            .with_columns(pl.col(pl.String).fill_null(""))
+        )
+        if conf["skip_empty_obj"]:
+            n_parsed = lf.filter(pl.col("Gloss") != "").select(pl.len()).collect()
+            log.info(f"Dropped {len(df) - n_parsed.item()} unparsed records.")
+            lf = lf.filter(pl.col("Gloss") != "")
+        lf = lf.filter(pl.col("Primary_Text") != "")
+        positions = lf.select("_position").collect()["_position"].to_numpy()
+        return self._to_pandas(lf.drop("_position"), df.index[positions])
+
+    def normalize(
+        self, df, aligned_fields, clitics=True, goal="Analyzed_Word", target="Gloss"
+    ):
+        """Polars version of `helpers.normalize_frame`."""
+        if len(df) == 0:
+            return df
+        pl = self.pl
+        aligned = [x for x in aligned_fields if x in df.columns]
+        lf = self._from_pandas(df).lazy()
+        if aligned:
+            lf = lf.with_columns(
+                pl.col(aligned)
+                .str.replace_all(helpers.HYPHEN_SPACE.pattern, "-")
+                .str.replace_all(helpers.WHITESPACE.pattern, "\t")
+            )
+        if goal in df.columns and target in df.columns:
+
+            def tabs(col, strip=False):
+                col = pl.col(col).str.strip_chars("\t") if strip else pl.col(col)
+                return col.str.count_matches("\t", literal=True)
+
+            # like fix_glosses: strip the glosses, then the words if needed
+            strip_target = tabs(goal) != tabs(target)
+            target_tabs = (
+                pl.when(strip_target)
+                .then(tabs(target, strip=True))
+                .otherwise(tabs(target))
+            )
+            strip_goal = tabs(goal) != target_tabs
+            lf = lf.with_columns(
+                [
+                    pl.when(mask)
+                    .then(pl.col(col).str.strip_chars("\t"))
+                    .otherwise(pl.col(col))
+                    .alias(col)
+                    for col, mask in [(target, strip_target), (goal, strip_goal)]
+                ]
+            )
+        if clitics and aligned:
+            lf = lf.with_columns(
+                pl.col(aligned).str.replace_all(helpers.CLITIC_TAB.pattern, "=")
+            )
+        if "Primary_Text" in df.columns:
+            lf = lf.with_columns(
+                pl.col("Primary_Text").str.replace_all(helpers.WHITESPACE.pattern, " ")
+            )
+        return self._to_pandas(lf, df.index)
+
+
+ENGINES = {"pandas": PandasEngine, "polars": PolarsEngine}
+
+
+def process_context():
+    """Get a multiprocessing context; processes are not forked once polars
+    is loaded, since its thread pool would not survive that."""
+    if "polars" in sys.modules:
+        return multiprocessing.get_context("spawn")
+    return multiprocessing.get_context()
+
+
+def get_engine(name=None):
+    """Get an engine by name; `None` is `DEFAULT_ENGINE`."""
+    return ENGINES[name or DEFAULT_ENGINE]()
@@ -0,0 +1,92 @@
+"""Streaming exports of analyzed examples, written chunk by chunk.
+
+Examples are written as soon as their words and morphs are known, so output
+starts with the first chunk (see `--chunk-size`). Two formats are available:
+
+* `jsonl`: one JSON object per example, with its `words` and their `morphs`
+* `conllu`: CoNLL-U-style blocks with one word per line; glosses, segmentations
+  and IDs are in the `MISC` column
+
+Morphs are only analyzed for the first occurrence of a wordform, so writers
+keep the morphs of every wordform they have seen.
+"""
+import json
+import sys
+
+WORD_COLUMNS = ["Wordform_ID", "Form", "Segmentation", "Gloss", "Parameter_ID"]
+MORPH_COLUMNS = ["Morph_ID", "Form", "Gloss"]
+
+
+class StreamWriter:
+    """Base class for streaming exports.
+
+    Args:
+        file (file object, optional): Where to write to; defaults to stdout.
+    """
+
+    def __init__(self, file=None):
+        self.file = file or sys.stdout
+        self.morphs = {}  # wordform ID: morphs
+
+    def write(self, examples, exampleparts, wordformparts=None):
+        """Write the examples of a chunk, with the slices found in it."""
+        if wordformparts is not None and len(wordformparts) > 0:
+            wordformparts = wordformparts.sort_values("Index", kind="stable")
+            for rec in wordformparts[["Wordform_ID"] + MORPH_COLUMNS].to_dict(
+                "records"
+            ):
+                self.morphs.setdefault(rec.pop("Wordform_ID"), []).append(rec)
+        words = {}
+        if len(exampleparts) > 0:
+            exampleparts = exampleparts.sort_values("Index", kind="stable")
+            for rec in exampleparts[["Example_ID"] + WORD_COLUMNS].to_dict("records"):
+                words.setdefault(rec.pop("Example_ID"), []).append(rec)
+        for example in examples.to_dict("records"):
+            self.write_example(example, words.get(example["ID"], []))
+        self.file.flush()
+
+    def write_example(self, example, words):
+        raise NotImplementedError
+
+
+class JSONLinesWriter(StreamWriter):
+    def write_example(self, example, words):
+        example["words"] = [
+            {**word, "morphs": self.morphs.get(word["Wordform_ID"], [])}
+            for word in words
+        ]
+        self.file.write(json.dumps(example, ensure_ascii=False, default=str) + "\n")
+
+
+def _misc(**values):
+    # CoNLL-U separates attributes with | and does not allow spaces
+    return "|".join(
+        f"{k}={str(v).replace('|', '/').replace(' ', '_')}"
+        for k, v in values.items()
+        if v
+    )
+
+
+class CoNLLUWriter(StreamWriter):
+    def write_example(self, example, words):
+        lines = [f"# sent_id = {example['ID']}"]
+        for key, comment in [
+            ("Primary_Text", "text"),
+            ("Translated_Text", "translation"),
+            ("Text_ID", "text_id"),
+        ]:
+            if example.get(key):
+                lines.append(f"# {comment} = {example[key]}")
+        for i, word in enumerate(words, start=1):
+            morphs = self.morphs.get(word["Wordform_ID"], [])
+            misc = _misc(
+                Wordform_ID=word["Wordform_ID"],
+                Segmentation=word["Segmentation"],
+                Gloss=word["Gloss"],
+                Morph_IDs=",".join(x["Morph_ID"] for x in morphs),
+            )
+            lines.append("\t".join([str(i), word["Form"]] + ["_"] * 7 + [misc or "_"]))
+        self.file.write("\n".join(lines) + "\n\n")
+
+
+WRITERS = {"jsonl": JSONLinesWriter, "conllu": CoNLLUWriter}
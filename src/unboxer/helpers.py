@@ -1,11 +1,67 @@
+import bz2
+import gzip
+import logging
+import lzma
+import re
+import sys
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
 import yaml
 from importlib_resources import files
-from slugify import slugify
+
+from unboxer.context import current
 
 DATA = files("unboxer") / "data"
 
+log = logging.getLogger(__name__)
+
+# file suffix: compression
+COMPRESSION = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+SUFFIXES = {v: k for k, v in COMPRESSION.items()}
+
+
+def load_zstandard():
+    try:
+        import zstandard  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        log.error("Use pip to install unboxer[zstd] to read and write .zst files.")
+        sys.exit()
+    return zstandard
+
+
+def open_text(path, mode="r", encoding="utf-8"):
+    """Open a text file, compressed or not (see `COMPRESSION`).
+
+    Compressed files are (de)compressed as a stream, according to their suffix.
+    """
+    compression = COMPRESSION.get(Path(path).suffix)
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding=encoding)
+    if compression == "bz2":
+        return bz2.open(path, mode + "t", encoding=encoding)
+    if compression == "xz":
+        return lzma.open(path, mode + "t", encoding=encoding)
+    if compression == "zstd":
+        return load_zstandard().open(path, mode + "t", encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+
+def strip_compression(path):
+    """The path of a file without its compression suffix, e.g. `texts.txt` for `texts.txt.gz`."""
+    path = Path(path)
+    if path.suffix in COMPRESSION:
+        return path.with_suffix("")
+    return path
+
+
+def table_path(directory, name, compression=None):
+    """The path of a CSV table in `directory`, with the suffix for `compression`."""
+    if compression == "zstd":
+        load_zstandard()  # pandas needs it as well
+    return Path(directory) / (name + SUFFIXES.get(compression, ""))
+
 
 def fix_glosses(rec, goal="Analyzed_Word", target="Gloss", sep="\t"):
     if rec[goal].count(sep) != rec[target].count(sep):
@@ -15,6 +71,144 @@ def fix_glosses(rec, goal="Analyzed_Word", target="Gloss", sep="\t"):
     return rec
 
 
+def fix_glosses_frame(df, goal="Analyzed_Word", target="Gloss", sep="\t"):
+    """Column-wise version of `fix_glosses`."""
+    if len(df) == 0:
+        return df
+    pattern = re.escape(sep)
+    goal_col, target_col = df[goal], df[target]
+    mismatch = goal_col.str.count(pattern) != target_col.str.count(pattern)
+    target_col = target_col.where(~mismatch, target_col.str.strip(sep))
+    mismatch = goal_col.str.count(pattern) != target_col.str.count(pattern)
+    goal_col = goal_col.where(~mismatch, goal_col.str.strip(sep))
+    return df.assign(**{goal: goal_col, target: target_col})
+
+
+HYPHEN_SPACE = re.compile(r" *- *")
+WHITESPACE = re.compile(r"\s+")
+CLITIC_TAB = re.compile(r"\t?=\t?")
+
+
+def normalize_aligned(text, clitics=True):
+    """Normalize an aligned field: remove spaces around hyphens, separate words
+    with single tabs and (optionally) attach clitics.
+
+    Returns the result and the number of tabs before and after stripping them
+    from the edges, counted before clitics are attached (see `fix_glosses`).
+    """
+    text = WHITESPACE.sub("\t", HYPHEN_SPACE.sub("-", text))
+    n_tabs = text.count("\t")
+    n_inner = text.strip("\t").count("\t")
+    if clitics:
+        text = CLITIC_TAB.sub("=", text)
+    return text, n_tabs, n_inner
+
+
+def normalize_frame(
+    df, aligned_fields, clitics=True, goal="Analyzed_Word", target="Gloss"
+):
+    """Normalize aligned fields and primary text with one pass per column.
+
+    Equivalent to removing spaces, running `fix_glosses` and then fixing clitics.
+    """
+    if len(df) == 0:
+        return df
+    columns = {}
+    counts = {}
+    for col in aligned_fields:
+        if col not in df.columns:
+            continue
+        texts, n_tabs, n_inner = zip(*[normalize_aligned(x, clitics) for x in df[col]])
+        columns[col] = pd.Series(texts, index=df.index)
+        counts[col] = np.array(n_tabs), np.array(n_inner)
+    if goal in df.columns and target in df.columns:
+        for col in [goal, target]:
+            if col not in counts:  # not normalized, count the raw values
+                columns[col] = df[col]
+                counts[col] = (
+                    df[col].str.count("\t").to_numpy(),
+                    df[col].str.strip("\t").str.count("\t").to_numpy(),
+                )
+        (goal_tabs, goal_inner), (target_tabs, target_inner) = (
+            counts[goal],
+            counts[target],
+        )
+        strip_target = goal_tabs != target_tabs
+        target_tabs = np.where(strip_target, target_inner, target_tabs)
+        strip_goal = goal_tabs != target_tabs
+        for col, mask in [(target, strip_target), (goal, strip_goal)]:
+            if mask.any():
+                columns[col] = columns[col].where(~mask, columns[col].str.strip("\t"))
+    if "Primary_Text" in df.columns:
+        columns["Primary_Text"] = df["Primary_Text"].str.replace(
+            WHITESPACE, " ", regex=True
+        )
+    return df.assign(**columns)
+
+
+class Replacer:
+    """Ordered regular expression replacements, like the `replace` configuration.
+
+    Every rule is applied to the result of the previous ones, as with one
+    `Series.replace(pattern, repl, regex=True)` per rule. The rules are compiled
+    once and results are cached, so they only run once per distinct string.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = [(re.compile(k), v) for k, v in (rules or {}).items()]
+        self._cache = {}
+
+    def __call__(self, text):
+        if text not in self._cache:
+            result = text
+            for pattern, repl in self.rules:
+                result = pattern.sub(repl, result)
+            self._cache[text] = result
+        return self._cache[text]
+
+    def apply(self, series):
+        """Apply the rules to a column of strings."""
+        if not self.rules or len(series) == 0:
+            return series
+        return series.map({x: self(x) for x in series.unique()})
+
+
+def compact_frame(df, threshold=0.5, exclude=None):
+    """Store repetitive string columns as categoricals.
+
+    Args:
+        df (pandas.DataFrame): The table.
+        threshold (float): Maximum ratio of unique values to rows for a column to be converted.
+        exclude (list): Columns to leave alone, e.g. ones that will be transformed later.
+    """
+    exclude = exclude or []
+    if len(df) == 0:
+        return df
+    converted = {}
+    for col in df.columns:
+        if col in exclude or not pd.api.types.is_string_dtype(df[col]):
+            continue
+        try:
+            n_unique = df[col].nunique()
+        except TypeError:  # list-valued column
+            continue
+        if n_unique / len(df) <= threshold:
+            converted[col] = df[col].astype("category")
+    return df.assign(**converted)
+
+
+def expand_frame(df):
+    """Turn categorical columns back into plain string columns."""
+    if df is None:
+        return df
+    converted = {
+        col: df[col].astype(df[col].cat.categories.dtype)
+        for col in df.columns
+        if isinstance(df[col].dtype, pd.CategoricalDtype)
+    }
+    return df.assign(**converted)
+
+
 def load_yaml(path):
     with open(path, "r", encoding="utf-8") as f:
         dic = yaml.load(f, Loader=yaml.SafeLoader)
@@ -64,27 +258,5 @@ def load_custom_config(config_path):
     return {}
 
 
-used_slugs = {}
-slug_dict = {}
-
-
 def _slugify(text, marker, ids=True):
-    used_slugs.setdefault(marker, [])
-    slug_dict.setdefault(marker, {})
-    if not ids and text in slug_dict[marker]:
-        return slug_dict[marker][text]
-    first = slugify(text)
-    if first == "":
-        first = "null"
-    if first not in used_slugs[marker]:
-        used_slugs[marker].append(first)
-        slug_dict[marker][text] = first
-        return first
-    i = 0
-    slug_cand = f"{first}-{i}"
-    while slug_cand in used_slugs[marker]:
-        i += 1
-        slug_cand = f"{first}-{i}"
-    used_slugs[marker].append(slug_cand)
-    slug_dict[marker][text] = slug_cand
-    return slug_cand
+    return current().slugify(text, marker, ids=ids)
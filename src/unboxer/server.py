@@ -0,0 +1,214 @@
+"""A local HTTP service for looking up extracted morphs, morphemes and wordforms.
+
+It serves the output directory of `corpus` (`morphs.csv`, `morphemes.csv` and
+`cldf/wordforms.csv`, if present, also compressed). All responses are JSON:
+
+* `GET /morphs?form=<form>` (or `/morphemes`, `/wordforms`): the records with that form
+* `GET /morphs/<ID>`: a single record
+* `GET /analyze?form=<form>&gloss=<gloss>`: the morph matched like during corpus extraction
+* `GET /metrics`: request counts, latencies and cache statistics
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+from morphinder import Morphinder
+
+from unboxer.helpers import COMPRESSION
+
+log = logging.getLogger(__name__)
+
+# table name: (file in the output directory, form column)
+TABLES = {
+    "morphs": ("morphs.csv", "Form"),
+    "morphemes": ("morphemes.csv", "Headword"),
+    "wordforms": ("cldf/wordforms.csv", "Form"),
+}
+
+
+class Lookup:
+    """In-memory indexes of the tables in an output directory.
+
+    Records are indexed by ID and by form; analyses use a `Morphinder` for the
+    morphs with a given form. Responses are kept in an LRU cache.
+
+    Args:
+        directory (pathlib.Path): The output directory of `corpus`.
+        cache_size (int): Maximum number of cached responses.
+    """
+
+    def __init__(self, directory, cache_size=1024):
+        directory = Path(directory)
+        self.tables = {}
+        for name, (filename, _) in TABLES.items():
+            for suffix in [""] + list(COMPRESSION):  # see `corpus --compress`
+                path = directory / (filename + suffix)
+                if path.is_file():
+                    self.tables[name] = pd.read_csv(
+                        path, dtype=str, keep_default_na=False
+                    )
+                    break
+        if "morphs" not in self.tables:
+            raise FileNotFoundError(f"There is no morphs.csv in {directory}")
+        self.ids = {}
+        self.forms = {}
+        for name, df in self.tables.items():
+            records = df.to_dict("records")
+            self.ids[name] = {rec["ID"]: rec for rec in records}
+            forms = {}
+            for rec in records:
+                forms.setdefault(rec[TABLES[name][1]], []).append(rec)
+            self.forms[name] = forms
+        morphs = self.tables["morphs"]
+        self._positions = morphs.groupby("Form", sort=False).indices
+        self._morphinders = {}
+        self._morphinder_lock = threading.Lock()  # they fill their caches on lookup
+        self.query = lru_cache(maxsize=cache_size)(self._query)
+
+    def analyze(self, form, gloss):
+        """Find the morph with a form and gloss, or return `None`."""
+        if form not in self._positions:  # no need to search the table
+            return None
+        with self._morphinder_lock:
+            # Morphinder only considers morphs with the same form, so it
+            # only needs to search those
+            if form not in self._morphinders:
+                self._morphinders[form] = Morphinder(
+                    self.tables["morphs"].iloc[self._positions[form]], complain=False
+                )
+            res = self._morphinders[form].retrieve_morph_id(
+                form, gloss, "", gloss_key="Meaning", type_key="Part_Of_Speech"
+            )
+        if not isinstance(res, tuple):  # some hits come without a sense
+            res = (res, None)
+        return self.ids["morphs"].get(res[0])
+
+    def _query(self, path, params):
+        params = dict(params)
+        parts = [x for x in path.split("/") if x]
+        if parts == ["analyze"]:
+            if "form" not in params or "gloss" not in params:
+                return 400, {"error": "Please specify form and gloss"}
+            morph = self.analyze(params["form"], params["gloss"])
+            morpheme = None
+            if morph and "morphemes" in self.ids:
+                morpheme = self.ids["morphemes"].get(morph.get("Morpheme_ID"))
+            return 200, {"morph": morph, "morpheme": morpheme}
+        if not parts or parts[0] not in self.tables or len(parts) > 2:
+            return 404, {"error": f"Unknown path {path}"}
+        if len(parts) == 2:
+            rec = self.ids[parts[0]].get(parts[1])
+            if rec is None:
+                return 404, {"error": f"No record with ID {parts[1]} in {parts[0]}"}
+            return 200, rec
+        if "form" not in params:
+            return 400, {"error": "Please specify form"}
+        return 200, self.forms[parts[0]].get(params["form"], [])
+
+
+class Metrics:
+    """Request counts and latencies per endpoint.
+
+    Args:
+        window (int): Number of recent requests used for latency percentiles.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.start = time.perf_counter()
+        self.counts = {}
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, seconds):
+        with self._lock:
+            counts = self.counts.setdefault(endpoint, {})
+            counts[status] = counts.get(status, 0) + 1
+            self.latencies.setdefault(endpoint, deque(maxlen=self.window)).append(
+                seconds
+            )
+
+    def summary(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint, latencies in self.latencies.items():
+                ms = np.array(latencies) * 1000
+                endpoints[endpoint] = {
+                    "requests": sum(self.counts[endpoint].values()),
+                    "status": {str(k): v for k, v in self.counts[endpoint].items()},
+                    "mean_ms": round(float(ms.mean()), 4),
+                    "p50_ms": round(float(np.percentile(ms, 50)), 4),
+                    "p95_ms": round(float(np.percentile(ms, 95)), 4),
+                    "max_ms": round(float(ms.max()), 4),
+                }
+        return {
+            "uptime": round(time.perf_counter() - self.start, 4),
+            "endpoints": endpoints,
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        tick = time.perf_counter()
+        url = urlsplit(self.path)
+        params = tuple(
+            sorted((k, v[0]) for k, v in parse_qs(url.query).items())
+        )  # hashable, for the cache
+        lookup = self.server.lookup
+        if url.path.rstrip("/") == "/metrics":
+            endpoint = "metrics"
+            info = lookup.query.cache_info()
+            status, data = 200, {
+                **self.server.metrics.summary(),
+                "cache": {
+                    "hits": info.hits,
+                    "misses": info.misses,
+                    "size": info.currsize,
+                    "maxsize": info.maxsize,
+                },
+            }
+        else:
+            endpoint = url.path.strip("/").split("/")[0]
+            if endpoint not in lookup.tables and endpoint != "analyze":
+                endpoint = "other"  # keep the metrics small
+            status, data = lookup.query(url.path, params)
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.metrics.record(endpoint, status, time.perf_counter() - tick)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        log.debug(format % args)
+
+
+def make_server(directory, host="127.0.0.1", port=8000, cache_size=1024):
+    """Load an output directory and create a server; port 0 picks a free port."""
+    lookup = Lookup(directory, cache_size=cache_size)
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.lookup = lookup
+    server.metrics = Metrics()
+    return server
+
+
+def run_server(directory, host="127.0.0.1", port=8000, cache_size=1024):
+    """Serve lookups in an output directory until interrupted."""
+    server = make_server(directory, host=host, port=port, cache_size=cache_size)
+    sizes = ", ".join(f"{len(v)} {k}" for k, v in server.lookup.tables.items())
+    log.info(f"Serving {sizes} at http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
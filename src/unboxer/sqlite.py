@@ -0,0 +1,145 @@
+"""Write extracted tables to a SQLite database."""
+import itertools
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from unboxer.chunks import chunks
+from unboxer.helpers import expand_frame
+
+log = logging.getLogger(__name__)
+
+# columns which get an index after loading, if present in a table
+FOREIGN_KEYS = [
+    "Example_ID",
+    "Wordform_ID",
+    "Morph_ID",
+    "Morpheme_ID",
+    "Stem_ID",
+    "Parameter_ID",
+    "Text_ID",
+    "Language_ID",
+]
+
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def _cell(value, sep):
+    if isinstance(value, (list, tuple)):
+        return sep.join(str(_cell(x, sep)) for x in value)
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    return value
+
+
+def _rows(df, sep):
+    for row in df.itertuples(index=False, name=None):
+        yield tuple(_cell(x, sep) for x in row)
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _create_indexes(con, name, columns):
+    if "ID" in columns:
+        try:
+            with con:
+                con.execute(
+                    f"CREATE UNIQUE INDEX {_quote(f'pk_{name}')} ON {_quote(name)} (ID)"
+                )
+        except sqlite3.IntegrityError:
+            log.warning(f"IDs in table {name} are not unique, creating plain index")
+            with con:
+                con.execute(
+                    f"CREATE INDEX {_quote(f'pk_{name}')} ON {_quote(name)} (ID)"
+                )
+    with con:
+        for col in columns:
+            if col in FOREIGN_KEYS:
+                con.execute(
+                    f"CREATE INDEX {_quote(f'fk_{name}_{col}')} ON {_quote(name)} ({_quote(col)})"
+                )
+
+
+def write_table(con, name, df, sep="; ", batch_size=10000):
+    """Load a dataframe into a (new) table, then index it.
+
+    Args:
+        con (sqlite3.Connection): The database connection.
+        name (str): The table name.
+        df (pandas.DataFrame or unboxer.chunks.ChunkedTable): The table content.
+        sep (str): Separator used for list-valued cells.
+        batch_size (int): Number of rows per `executemany` call.
+    """
+    frames = (expand_frame(x) for x in chunks(df))
+    first = next(frames)  # column types are taken from the first chunk
+    columns = list(first.columns)
+    coldefs = ", ".join(
+        f"{_quote(col)} {_sql_type(dtype)}" for col, dtype in first.dtypes.items()
+    )
+    placeholders = ", ".join(["?"] * len(columns))
+    with con:
+        con.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        con.execute(f"CREATE TABLE {_quote(name)} ({coldefs})")
+    insert = f"INSERT INTO {_quote(name)} VALUES ({placeholders})"
+    with con:  # one transaction per table
+        for frame in itertools.chain([first], frames):
+            for batch in _batches(_rows(frame, sep), batch_size):
+                con.executemany(insert, batch)
+    _create_indexes(con, name, columns)
+
+
+def write_sqlite(tables, db_path, sep="; ", batch_size=10000):
+    """Write a number of tables to a SQLite database.
+
+    Args:
+        tables (dict): Maps table names (e.g. `examples` or `examples.csv`) to dataframes.
+        db_path (str or pathlib.Path): The database file; existing tables are replaced.
+        sep (str): Separator used for list-valued cells.
+        batch_size (int): Number of rows per `executemany` call.
+    """
+    db_path = Path(db_path)
+    db_path.parent.mkdir(exist_ok=True, parents=True)
+    tick = time.perf_counter()
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute("PRAGMA journal_mode = WAL")
+        con.execute("PRAGMA synchronous = OFF")
+        for name, df in tables.items():
+            if df is None or len(df.columns) == 0:
+                continue
+            name = name.replace(".csv", "")
+            if isinstance(df, pd.DataFrame) and df.index.name:
+                # e.g. tables loaded with index_col="ID"
+                df = df.reset_index()
+            write_table(con, name, df, sep=sep, batch_size=batch_size)
+            log.debug(f"Wrote {len(df)} rows to table {name}")
+    finally:
+        con.close()
+    tock = time.perf_counter()
+    log.info(f"Wrote database {db_path.resolve()} in {tock - tick:0.4f} seconds")
@@ -1,7 +1,53 @@
 from pathlib import Path
 import pytest
+from click.testing import CliRunner
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--engine",
+        default="pandas",
+        choices=["pandas", "polars"],
+        help="DataFrame engine used by the tests",
+    )
+
+
+@pytest.fixture(autouse=True)
+def engine(request, monkeypatch):
+    name = request.config.getoption("--engine")
+    if name == "polars":
+        pytest.importorskip("polars")
+    monkeypatch.setattr("unboxer.engines.DEFAULT_ENGINE", name)
+    return name
 
 
 @pytest.fixture
 def data():
     return Path(__file__).parent / "data"
+
+
+@pytest.fixture
+def run_corpus(data, tmp_path):
+    """Run `unbox corpus` with the test configuration, writing to `tmp_path / output`.
+
+    `files` defaults to the test corpus; `lexicon` and `cldf` add the test
+    lexicon and a CLDF dataset (with the test languages).
+    """
+    from unboxer.cli import corpus  # pylint: disable=import-outside-toplevel
+
+    def run(output=".", *args, files=None, conf=None, lexicon=False, cldf=False):
+        options = ["--conf", str(conf or data / "pemon.yaml")]
+        options += ["--output", str(tmp_path / output)]
+        if lexicon:
+            options += ["--lexicon", str(data / "pem_lex_tb.txt")]
+        if cldf:
+            options += ["--languages", str(data / "languages.csv"), "--cldf"]
+        return CliRunner().invoke(
+            corpus,
+            [str(x) for x in files or [data / "pem_txt_tb.txt"]]
+            + options
+            + [str(x) for x in args],
+            catch_exceptions=False,
+        )
+
+    return run
@@ -1,8 +1,9 @@
 """Tests for the unboxer module.
 """
 from click.testing import CliRunner
-from unboxer.cli import corpus
+from unboxer.cli import corpus, dictionary
 from pycldf import Dataset
+import pandas as pd
 
 
 # def test_toolbox(data, tmp_path):
@@ -48,6 +49,7 @@ def test_shoebox(data, tmp_path):
     ds = Dataset.from_metadata(tmp_path / "cldf" / "metadata.json")
     assert ds.validate()
 
+
 def test_toolbox(data, tmp_path):
     runner = CliRunner()
     runner.invoke(
@@ -67,4 +69,782 @@ def test_toolbox(data, tmp_path):
     assert (tmp_path / "pem_txt_tb.csv").is_file()
     assert (tmp_path / "cldf" / "examples.csv").is_file()
     ds = Dataset.from_metadata(tmp_path / "cldf" / "metadata.json")
-    assert ds.validate()
\ No newline at end of file
+    assert ds.validate()
+
+
+def test_output_db(data, tmp_path):
+    import sqlite3
+
+    runner = CliRunner()
+    runner.invoke(
+        corpus,
+        [
+            str(data / "pem_txt_tb.txt"),
+            "--conf",
+            str(data / "pemon.yaml"),
+            "--output",
+            tmp_path,
+            "--lexicon",
+            str(data / "pem_lex_tb.txt"),
+            "--output-db",
+            str(tmp_path / "pemon.sqlite"),
+        ],
+        catch_exceptions=False,
+    )
+    assert not (tmp_path / "pem_txt_tb.csv").is_file()
+    con = sqlite3.connect(tmp_path / "pemon.sqlite")
+    for table in ["examples", "exampleparts", "wordforms", "morphs", "morphemes"]:
+        assert con.execute(f"SELECT count(*) FROM {table}").fetchone()[0] > 0
+    indexes = [
+        x[0] for x in con.execute("SELECT name FROM sqlite_master WHERE type='index'")
+    ]
+    assert "pk_examples" in indexes
+    assert "fk_exampleparts_Example_ID" in indexes
+
+
+def test_duplicates(data, tmp_path, run_corpus):
+    content = (data / "pem_txt_tb.txt").read_text(encoding="utf-8")
+    records = content.split("\\ref ")
+    # an identical copy of the first record and a conflicting copy of the second
+    content += "\n\\ref " + records[1] + "\n\\ref " + records[2].replace("pane", "pana")
+    db = tmp_path / "dupes.txt"
+    db.write_text(content, encoding="utf-8")
+    run_corpus(files=[db])
+    dupes = pd.read_csv(tmp_path / "duplicates.csv")
+    assert list(dupes["Type"]) == ["identical", "conflict"]
+    assert len(pd.read_csv(tmp_path / "dupes.csv")) == len(records) - 1
+
+
+def test_low_memory(data, tmp_path, monkeypatch, run_corpus):
+    from unboxer.chunks import ChunkedTable
+
+    # repeated records, so that the slice columns are repetitive
+    header, *records = (data / "pem_txt_tb.txt").read_text("utf-8").split("\\ref ")
+    copies = [f"c{i}{x}" for i in range(4) for x in records]
+    corpus = tmp_path / "texts.txt"
+    corpus.write_text("\\ref ".join([header] + copies), encoding="utf-8")
+    dtypes = {}
+    append = ChunkedTable.append
+
+    def record_dtypes(self, df):
+        if df is not None:
+            dtypes[self.name] = df.dtypes
+        append(self, df)
+
+    monkeypatch.setattr(ChunkedTable, "append", record_dtypes)
+    run_corpus("full", files=[corpus], lexicon=True, cldf=True)
+    assert dtypes["exampleparts"]["Form"] != "category"
+    run_corpus("low", "--low-memory", files=[corpus], lexicon=True, cldf=True)
+    for col in ["Form", "Segmentation", "Gloss"]:
+        assert dtypes["exampleparts"][col] == "category"
+    ds = Dataset.from_metadata(tmp_path / "low" / "cldf" / "metadata.json")
+    assert ds.validate()
+    assert len(list(ds["exampleparts.csv"])) > 0
+    # the output is the same
+    for path in (tmp_path / "full").glob("**/*.csv"):
+        low = tmp_path / "low" / path.relative_to(tmp_path / "full")
+        assert low.read_bytes() == path.read_bytes()
+
+
+def test_chunks(tmp_path, run_corpus):
+    for output, args in [("full", []), ("chunks", ["--chunk-size", "2"])]:
+        (tmp_path / output).mkdir()
+        run_corpus(output, *args, lexicon=True, cldf=True)
+    full = Dataset.from_metadata(tmp_path / "full" / "cldf" / "metadata.json")
+    chunked = Dataset.from_metadata(tmp_path / "chunks" / "cldf" / "metadata.json")
+    assert chunked.validate()
+    for table in ["examples.csv", "exampleparts.csv", "wordforms.csv", "morphs.csv"]:
+        assert len(list(chunked[table])) == len(list(full[table]))
+    assert not list((tmp_path / "chunks").glob(".chunks-*"))
+
+
+def test_include(tmp_path, run_corpus):
+    (tmp_path / "include.yaml").write_text("- '002'\n", encoding="utf-8")
+    run_corpus(".", "--include", tmp_path / "include.yaml", lexicon=True, cldf=True)
+    ds = Dataset.from_metadata(tmp_path / "cldf" / "metadata.json")
+    assert ds.validate()
+    assert [x["ID"] for x in ds["ExampleTable"]] == ["002"]
+    # only morphs used in the included record are exported
+    used = {x["Morph_ID"] for x in ds["wordformparts.csv"]}
+    assert {x["ID"] for x in ds["morphs.csv"]} == used
+
+
+def test_include_chunks(tmp_path, run_corpus):
+    (tmp_path / "include.yaml").write_text("- '002'\n", encoding="utf-8")
+    # without a lexicon, the morphs come from a separate pass in chunked mode
+    for output, args in [("full", []), ("chunks", ["--chunk-size", "1"])]:
+        run_corpus(output, "--include", tmp_path / "include.yaml", *args, cldf=True)
+    for path in (tmp_path / "full").glob("**/*.csv"):
+        chunked = tmp_path / "chunks" / path.relative_to(tmp_path / "full")
+        assert chunked.read_bytes() == path.read_bytes()
+
+
+def test_slice_keys():
+    from unboxer import build_slices, materialize_ids
+
+    df = pd.DataFrame(
+        {
+            "ID": ["a", "b"],
+            "Analyzed_Word": ["x y- z", "x"],
+            "Gloss": ["X Y- Z", "X"],
+        }
+    )
+    slices = build_slices(df, ids=False)[2]
+    assert "ID" not in slices.columns
+    assert list(slices["Example_ID"].cat.codes) == [0, 0, 1]
+    slices = materialize_ids(slices)[0]
+    assert list(slices["ID"]) == ["a-0", "a-1", "b-0"]
+    assert list(slices["Form"]) == ["x", "yz", "x"]
+
+
+def test_dictionary_examples(data, tmp_path):
+    runner = CliRunner()
+    runner.invoke(
+        dictionary,
+        [
+            str(data / "pem_lex_tb.txt"),
+            "--conf",
+            str(data / "pemon.yaml"),
+            "--output",
+            tmp_path,
+            "--languages",
+            str(data / "languages.csv"),
+            "--examples",
+            str(data / "pem_txt_tb.txt"),
+            "--cldf",
+        ],
+        input="pemo1248\n",
+        catch_exceptions=False,
+    )
+    ds = Dataset.from_metadata(tmp_path / "cldf" / "metadata.json")
+    assert len(list(ds["ExampleTable"])) > 0
+    # the examples were analyzed with the dictionary's lexicon
+    morphs = pd.read_csv(tmp_path / "morphs.csv")
+    entries = pd.read_csv(tmp_path / "pem_lex_tb.csv")
+    assert set(morphs["Morpheme_ID"]) == set(entries["ID"])
+
+
+def test_unsupported_options(data, tmp_path):
+    from unboxer.cli import wordlist
+
+    for command in [wordlist, dictionary]:
+        result = CliRunner().invoke(
+            command,
+            [
+                str(data / "pem_lex_tb.txt"),
+                "--output",
+                tmp_path,
+                "--segments",
+                str(data / "languages.csv"),
+            ],
+        )
+        assert result.exit_code == 2
+        assert "Not supported by this command: --segments" in result.output
+    assert not list(tmp_path.iterdir())
+
+
+def test_dictionary_output_db(data, tmp_path):
+    import sqlite3
+
+    CliRunner().invoke(
+        dictionary,
+        [
+            str(data / "pem_lex_tb.txt"),
+            "--conf",
+            str(data / "pemon.yaml"),
+            "--examples",
+            str(data / "pem_txt_tb.txt"),
+            "--output",
+            tmp_path,
+            "--output-db",
+            str(tmp_path / "pemon.sqlite"),
+        ],
+        catch_exceptions=False,
+    )
+    con = sqlite3.connect(tmp_path / "pemon.sqlite")
+    # the morphs of the analyzed examples are not replaced by the bare lexicon
+    columns = [x[1] for x in con.execute("PRAGMA table_info(morphs)")]
+    assert {"Language_ID", "Name", "Parameter_ID", "Morpheme_ID"} <= set(columns)
+    assert con.execute("SELECT count(*) FROM parameters").fetchone()[0] > 0
+    assert con.execute("SELECT count(*) FROM morphemes").fetchone()[0] > 0
+
+
+def test_link_senses():
+    from unboxer.cldf import link_senses
+
+    senses = pd.DataFrame(
+        {"ID": ["s1", "s2", "s3"], "Example_IDs": ["e1 ; e2", "e2", ""]}
+    )
+    examples = pd.DataFrame({"ID": ["e1", "e2", "e3"]})
+    assert link_senses(senses, examples) == [["s1"], ["s1", "s2"], []]
+
+
+def test_normalize_frame():
+    import re
+    from unboxer.helpers import fix_glosses, normalize_frame
+
+    def remove_spaces(text):
+        for sep in ["- ", " -"]:
+            while sep in text:
+                text = text.replace(sep, sep.strip())
+        return re.sub(r"\s+", "\t", text)
+
+    words = [" a - b  c ", "a =b", "x\t=  y -\tz", "  ", "a  -  - b", "= a ="]
+    glosses = ["A-B C", " 1 = 2", "X=Y\tZ ", "", "A--B", " = A = "]
+    df = pd.DataFrame(
+        {
+            "Analyzed_Word": words,
+            "Gloss": glosses,
+            "Primary_Text": [x + "\n " for x in words],
+        }
+    )
+    for clitics in [True, False]:
+        expected = []
+        for rec in df.to_dict("records"):
+            for col in ["Analyzed_Word", "Gloss"]:
+                rec[col] = remove_spaces(rec[col])
+            rec = fix_glosses(rec)
+            for col in ["Analyzed_Word", "Gloss"]:
+                if clitics:
+                    rec[col] = rec[col].replace("=\t", "=").replace("\t=", "=")
+            rec["Primary_Text"] = re.sub(r"\s+", " ", rec["Primary_Text"])
+            expected.append(rec)
+        res = normalize_frame(df, ["Analyzed_Word", "Gloss"], clitics=clitics)
+        assert res.to_dict("records") == expected
+
+
+def test_batch(data, tmp_path):
+    from unboxer.cli import batch
+
+    manifest = tmp_path / "manifest.yaml"
+    manifest.write_text(
+        f"""jobs: 2
+defaults:
+  conf: {data / "pemon.yaml"}
+  languages: {data / "languages.csv"}
+projects:
+  - name: toolbox
+    files: {data / "pem_txt_tb.txt"}
+  - name: shoebox
+    files: [{data / "pem_txt_sb.db"}]
+    format: shoebox
+  - name: broken
+    files: {data / "pem_txt_tb.txt"}
+    format: shoebox
+    segments: missing.csv
+""",
+        encoding="utf-8",
+    )
+    runner = CliRunner()
+    runner.invoke(batch, [str(manifest)], catch_exceptions=False)
+    assert (tmp_path / "toolbox" / "pem_txt_tb.csv").is_file()
+    assert (tmp_path / "shoebox" / "pem_txt_sb.csv").is_file()
+    summary = pd.read_csv(tmp_path / "batch_summary.csv")
+    assert list(summary["Status"]) == ["done", "done", "failed"]
+
+
+def test_partition(data, tmp_path, run_corpus):
+    content = (data / "pem_txt_tb.txt").read_text(encoding="utf-8")
+    copy = tmp_path / "copy.txt"
+    copy.write_text(content.replace("\\ref ", "\\ref x"), encoding="utf-8")
+    run_corpus(
+        ".",
+        "--partition",
+        "filename",
+        "--merge",
+        "--jobs",
+        "2",
+        files=[data / "pem_txt_tb.txt", copy],
+        lexicon=True,
+        cldf=True,
+    )
+    index = pd.read_csv(tmp_path / "cldf" / "partitions.csv")
+    assert list(index["Partition"]) == ["pem_txt_tb.txt", "copy.txt"]
+    shards = [
+        Dataset.from_metadata(tmp_path / "cldf" / x / "metadata.json")
+        for x in index["Directory"]
+    ]
+    assert all(ds.validate() for ds in shards)
+    shared = Dataset.from_metadata(tmp_path / "cldf" / "shared" / "metadata.json")
+    assert shared.get("ExampleTable") is None
+    merged = Dataset.from_metadata(tmp_path / "cldf" / "merged" / "metadata.json")
+    assert merged.validate()
+    examples = [len(list(ds["ExampleTable"])) for ds in shards]
+    assert len(list(merged["ExampleTable"])) == sum(examples) == index["Examples"].sum()
+
+
+def test_partition_language(data, tmp_path, monkeypatch, run_corpus):
+    calls = []
+
+    def get_lg(lg_id, languages=None):  # instead of a Glottolog lookup
+        calls.append(lg_id)
+        return {"ID": lg_id, "Name": "Pemon"}
+
+    monkeypatch.setattr("unboxer.cldf.get_lg", get_lg)
+    run_corpus(".", "--cldf", "--partition", "filename", "--jobs", "1")
+    # looked up once for the shared dataset and all partitions
+    assert calls == ["pemo1248"]
+    for name in ["shared", "pem-txt-tb-txt"]:
+        languages = pd.read_csv(tmp_path / "cldf" / name / "languages.csv")
+        assert list(languages["Name"]) == ["Pemon"]
+
+
+def test_extract_morphs():
+    from unboxer import extract_morphs
+
+    lexicon = pd.DataFrame(
+        {
+            "ID": ["a", "b"],
+            "Headword": ["ka", "pe"],
+            "Meaning": ["A", "B"],
+            "Part_Of_Speech": ["n", "v"],
+            "Variants": ["ko; ku", ""],
+        }
+    )
+    morphemes, morphs = extract_morphs(lexicon, "; ")
+    assert morphemes.equals(lexicon)
+    assert list(morphs["ID"]) == ["a", "a-0", "a-1", "b"]
+    assert list(morphs["Form"]) == ["ka", "ko", "ku", "pe"]
+    assert list(morphs["Morpheme_ID"]) == ["a", "a", "a", "b"]
+
+
+def test_collect_morphs():
+    import re
+    from unboxer import _aligned_tokens, _collect_morphs
+    from unboxer.context import ExtractionContext, humidify
+
+    df = pd.DataFrame(
+        {
+            # more objects than glosses, more glosses than objects, empty lines
+            "Analyzed_Word": ["ka -pe  ro", "pe  ka", "", "ka  ro -pe  ti", "ka"],
+            "Gloss": ["A  -B", "B A  C", "X", "A  R  -B  T", "A"],
+        }
+    )
+    objs, glosses = _aligned_tokens(df["Analyzed_Word"], df["Gloss"])
+    assert list(objs) == ["ka", "-pe", "pe", "ka", "", "ka", "ro", "-pe", "ti", "ka"]
+    assert list(glosses) == ["A", "-B", "B", "A", "X", "A", "R", "-B", "T", "A"]
+
+    def old(df, morphs):  # the per-token loop this replaced
+        for rec in df.to_dict("records"):
+            objs = re.split(r"\s+", rec["Analyzed_Word"])
+            glosses = re.split(r"\s+", rec["Gloss"])
+            for obj, gloss in zip(objs, glosses):
+                if obj == "":
+                    continue
+                morph_id = humidify(obj + "-" + gloss, key="pairs")
+                if morph_id not in morphs:
+                    morphs[morph_id] = {
+                        "ID": morph_id,
+                        "Form": obj,
+                        "Meaning": gloss.strip("-").strip("="),
+                    }
+        return morphs
+
+    with ExtractionContext().activate():
+        expected = old(df, {})
+    with ExtractionContext().activate():
+        morphs = _collect_morphs(df, {})
+    # same morphs and IDs, in order of first occurrence
+    assert list(morphs.items()) == list(expected.items())
+    assert [x["Form"] for x in morphs.values()] == ["ka", "-pe", "pe", "ro", "ti"]
+
+
+def test_without_ids():
+    from unboxer import _without_ids
+
+    records = [{"ID": x, "Name": x.upper()} for x in ["c", "a", "b", "a", "d"]]
+    # overlapping IDs are dropped, the others keep their order
+    result = _without_ids(records, pd.Series(["a", "e", "a"]))
+    assert list(result["ID"]) == ["c", "b", "d"]
+    assert list(result["Name"]) == ["C", "B", "D"]
+    assert list(_without_ids(records, [])["ID"]) == ["c", "a", "b", "a", "d"]
+    assert len(_without_ids([], ["a"])) == 0
+    assert len(_without_ids(records, ["a", "b", "c", "d"])) == 0
+
+
+def test_unchanged_cldf(tmp_path, run_corpus):
+    import json
+
+    run_corpus(cldf=True)
+    cldf = tmp_path / "cldf"
+    digests = json.loads((cldf / "digests.json").read_text(encoding="utf-8"))
+    assert "examples.csv" in digests
+    mtimes = {x.name: x.stat().st_mtime_ns for x in cldf.iterdir()}
+    run_corpus(cldf=True)
+    assert {x.name: x.stat().st_mtime_ns for x in cldf.iterdir()} == mtimes
+    # a lexicon changes some tables and adds one
+    run_corpus(cldf=True, lexicon=True)
+    assert (cldf / "morphemes.csv").stat().st_mtime_ns not in mtimes.values()
+    assert (cldf / "languages.csv").stat().st_mtime_ns == mtimes["languages.csv"]
+    assert Dataset.from_metadata(cldf / "metadata.json").validate()
+    assert not list(tmp_path.glob(".cldf-*"))
+
+
+def test_replacer():
+    from unboxer.helpers import Replacer
+
+    # later rules see the results of earlier ones
+    rules = {"ö": "o", "o([nk])": r"oh\1", "hk": "sh", "^p": "b"}
+    forms = pd.Series(["penatokon", "sörö", "pök", "sörö", ""])
+    expected = forms.copy()
+    for orig, repl in rules.items():
+        expected = expected.replace(orig, repl, regex=True)
+    assert Replacer(rules).apply(forms).equals(expected)
+    assert list(expected) == ["benatoshohn", "soro", "bosh", "soro", ""]
+
+
+def test_serve(tmp_path, run_corpus):
+    import json
+    import threading
+    from urllib.error import HTTPError
+    from urllib.parse import quote
+    from urllib.request import urlopen
+    from unboxer.server import make_server
+
+    run_corpus(lexicon=True, cldf=True)
+    morphs = pd.read_csv(tmp_path / "morphs.csv", keep_default_na=False)
+    morph = morphs.iloc[0]
+    server = make_server(tmp_path, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def get(path):
+        url = f"http://127.0.0.1:{server.server_port}{path}"
+        try:
+            with urlopen(url) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    try:
+        assert get(f"/morphs/{morph['ID']}") == (200, json.loads(morph.to_json()))
+        status, hits = get(f"/morphs?form={quote(morph['Form'])}")
+        assert morph["ID"] in [x["ID"] for x in hits]
+        query = f"/analyze?form={quote(morph['Form'])}&gloss={quote(morph['Meaning'])}"
+        for _ in range(2):
+            status, res = get(query)
+            assert res["morph"]["ID"] == morph["ID"]
+            assert res["morpheme"]["ID"] == morph["Morpheme_ID"]
+        assert get("/analyze?form=xyz&gloss=abc") == (
+            200,
+            {"morph": None, "morpheme": None},
+        )
+        assert get("/wordforms?form=penatokon")[1][0]["Description"] == "ancient-PL"
+        assert get("/morphs/nonexistent")[0] == 404
+        assert get("/foo")[0] == 404
+        metrics = get("/metrics")[1]
+        assert metrics["endpoints"]["analyze"]["requests"] == 3
+        assert metrics["cache"]["hits"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_errors_log(tmp_path, caplog, run_corpus):
+    import logging
+    from unboxer.diagnostics import Diagnostics
+
+    log = logging.getLogger("unboxer")
+    handlers = list(log.handlers)
+    for _ in range(2):
+        run_corpus("new", lexicon=True)
+    # the handler for errors.log only lives as long as the run
+    assert log.handlers == handlers
+    errors = (tmp_path / "new" / "errors.log").read_text(encoding="utf-8")
+    assert errors.count("chinoro ‘at_first’") == 1
+
+    diagnostics = Diagnostics(max_contexts=2)
+    for ex_id in ["a", "b", "c"]:
+        diagnostics.add("Missing glosses", "pe", ex_id)
+    diagnostics.add("Missing glosses", "ya", "a")
+    assert len(diagnostics) == 4
+    caplog.clear()
+    diagnostics.write(logging.getLogger("test_diagnostics"))
+    assert caplog.messages == [
+        "Missing glosses (4 in total, 2 distinct):\n  pe (3 times) in a, b, ...\n  ya in a"
+    ]
+    assert len(diagnostics) == 0
+
+
+def test_stream(tmp_path, run_corpus):
+    import json
+
+    def run(*args):
+        return run_corpus(".", *args, lexicon=True)
+
+    run("--to", "jsonl", "--to-file", tmp_path / "full.jsonl")
+    run("--to", "jsonl", "--to-file", tmp_path / "chunks.jsonl", "--chunk-size", "1")
+    lines = (tmp_path / "full.jsonl").read_text(encoding="utf-8").splitlines()
+    assert lines == (tmp_path / "chunks.jsonl").read_text(encoding="utf-8").splitlines()
+    examples = pd.read_csv(tmp_path / "pem_txt_tb.csv", dtype=str)
+    records = [json.loads(x) for x in lines]
+    assert [x["ID"] for x in records] == list(examples["ID"])
+    word = records[0]["words"][1]
+    assert word["Segmentation"] == "penato-kon"
+    assert [x["Morph_ID"] for x in word["morphs"]] == ["penato-ancient", "kon-pl"]
+    # repeated wordforms have morphs, too
+    assert all(w["morphs"] for r in records for w in r["words"] if w["Form"] == "pe")
+
+    result = run("--to", "conllu")
+    blocks = result.stdout.strip().split("\n\n")
+    assert len(blocks) == len(records)
+    assert blocks[0].splitlines()[2 + 2].split("\t")[:2] == ["2", "penatokon"]
+
+
+def test_resume(data, tmp_path, monkeypatch, run_corpus):
+    import shutil
+    import pytest
+    import unboxer
+
+    shutil.copy(data / "pem_txt_tb.txt", tmp_path / "texts.txt")
+
+    def run(output, *args):
+        run_corpus(
+            output, *args, files=[tmp_path / "texts.txt"], lexicon=True, cldf=True
+        )
+
+    def fail(*args, **kwargs):
+        raise RuntimeError
+
+    run("fresh")
+    with monkeypatch.context() as m:
+        m.setattr(unboxer, "create_cldf", fail)
+        with pytest.raises(RuntimeError):
+            run("resumed", "--checkpoint")
+    assert (tmp_path / "resumed" / ".checkpoints" / "tables.pkl").is_file()
+    with monkeypatch.context() as m:  # nothing is analyzed again
+        m.setattr(unboxer, "build_slices", fail)
+        run("resumed", "--resume")
+        fresh, resumed = (tmp_path / x / "cldf" for x in ["fresh", "resumed"])
+        for path in fresh.iterdir():  # requirements.txt lists the loaded packages
+            if path.name not in ["requirements.txt", "digests.json"]:
+                assert path.read_bytes() == (resumed / path.name).read_bytes()
+        # changed inputs invalidate the checkpoints
+        with open(tmp_path / "texts.txt", "a", encoding="utf-8") as f:
+            f.write("\n")
+        with pytest.raises(RuntimeError):
+            run("resumed", "--resume")
+
+
+def test_sample(data, tmp_path, run_corpus):
+    import pytest
+    import yaml
+
+    content = (data / "pem_txt_tb.txt").read_text(encoding="utf-8")
+    header, *records = content.split("\\ref ")
+    records = [f"{i}{x}" for i in range(5) for x in records]
+    (tmp_path / "texts.txt").write_text("\\ref ".join([header] + records), "utf-8")
+
+    def run(output, *args, conf=None):
+        run_corpus(output, *args, files=[tmp_path / "texts.txt"], conf=conf)
+        return pd.read_csv(tmp_path / output / "texts.csv", dtype=str)
+
+    assert list(run("limit", "--limit", "3")["ID"]) == ["0-001", "0-002", "1-001"]
+    sample = run("sample", "--sample", "4", "--seed", "1")
+    assert len(sample) == 4 and sample["ID"].is_monotonic_increasing
+    chunks = run("chunks", "--sample", "4", "--seed", "1", "--chunk-size", "3")
+    assert sample.equals(chunks)
+    assert pd.read_csv(tmp_path / "sample" / "morphs.csv").equals(
+        pd.read_csv(tmp_path / "chunks" / "morphs.csv")
+    )
+    # mistakes in the configuration are found before parsing
+    conf = yaml.safe_load((data / "pemon.yaml").read_text(encoding="utf-8"))
+    conf.setdefault("interlinear_mappings", {})["mbx"] = "Analyzed_Word"
+    conf["interlinear_mappings"]["mb"] = "Morphs"
+    (tmp_path / "conf.yaml").write_text(yaml.dump(conf), encoding="utf-8")
+    with pytest.raises(ValueError, match="no such field"):
+        run("broken", conf=tmp_path / "conf.yaml")
+
+
+def test_compression(data, tmp_path, run_corpus):
+    import bz2
+    import gzip
+
+    with open(data / "pem_txt_tb.txt", "rb") as f:
+        (tmp_path / "pem_txt_tb.txt.gz").write_bytes(gzip.compress(f.read()))
+    with open(data / "pem_lex_tb.txt", "rb") as f:
+        (tmp_path / "pem_lex_tb.txt.bz2").write_bytes(bz2.compress(f.read()))
+
+    def run(corpus_file, lexicon, output, *args):
+        run_corpus(output, "--lexicon", lexicon, *args, files=[corpus_file])
+
+    run(data / "pem_txt_tb.txt", data / "pem_lex_tb.txt", "plain")
+    run(
+        tmp_path / "pem_txt_tb.txt.gz",
+        tmp_path / "pem_lex_tb.txt.bz2",
+        "compressed",
+        "--compress",
+        "xz",
+    )
+    run(
+        tmp_path / "pem_txt_tb.txt.gz",
+        tmp_path / "pem_lex_tb.txt.bz2",
+        "chunks",
+        "--compress",
+        "gzip",
+        "--chunk-size",
+        "3",
+    )
+
+    def read(path):  # the filename column contains the name of the input file
+        return pd.read_csv(path, dtype=str).drop(columns="filename", errors="ignore")
+
+    for name in ["pem_txt_tb.csv", "morphs.csv", "morphemes.csv"]:
+        expected = read(tmp_path / "plain" / name)
+        assert expected.equals(read(tmp_path / "compressed" / (name + ".xz")))
+        assert expected.equals(read(tmp_path / "chunks" / (name + ".gz")))
+
+
+def test_engines(tmp_path, run_corpus):
+    import pytest
+    from unboxer.engines import PandasEngine, PolarsEngine
+
+    pytest.importorskip("polars")
+    df = pd.DataFrame(
+        {
+            "Analyzed_Word": [" a - b  c ", "a =b", "x\t=  y -\tz", "= a ="],
+            "Gloss": ["A-B C", " 1 = 2", "X=Y\tZ ", " = A = "],
+            "Primary_Text": ["a  b\n", "ab", "xyz", " a "],
+        },
+        index=[3, 1, 2, 0],
+    )
+    for clitics in [True, False]:
+        expected = PandasEngine().normalize(df, ["Analyzed_Word", "Gloss"], clitics)
+        res = PolarsEngine().normalize(df, ["Analyzed_Word", "Gloss"], clitics)
+        assert res.astype(str).equals(expected.astype(str))
+
+    def run(engine):
+        run_corpus(engine, "--engine", engine)
+        return pd.read_csv(tmp_path / engine / "pem_txt_tb.csv", dtype=str)
+
+    assert run("pandas").equals(run("polars"))
+
+
+def test_record_columns():
+    from unboxer import _get_fields
+    from unboxer.chunks import RecordColumns
+
+    records = [
+        "\\ref 1\n\\tx a b\ncontinued\n\\ge x\n\\ge y\n\\nt one\n\\nt two\n",
+        "\\ref 2\n\\ge z\n\\empty\n\\tx c ",
+        "\\ref 3\n\\tx d\n\\tx\ncontinued",
+        "\\ref 4\n\\tx\n",
+    ]
+    fields = [_get_fields(x, "\\ref", ["\\nt"], "; ") for x in records]
+    assert fields[0] == {
+        "\\ref": "1",
+        "\\tx": "a b continued",
+        "\\ge": "x y",
+        "\\nt": "one; two",
+    }
+    assert fields[2]["\\tx"] == " continued"
+    assert fields[3] is None
+    recs = RecordColumns()
+    for rec in fields[:3]:
+        recs.append(rec)
+    assert len(recs) == 3
+    assert recs.to_frame().equals(pd.DataFrame.from_dict(fields[:3]))
+
+
+def test_concurrent_runs(data, tmp_path):
+    import copy
+    from concurrent.futures import ThreadPoolExecutor
+    from unboxer import extract_corpus
+    from unboxer.helpers import load_config
+
+    conf = load_config(data / "pemon.yaml")
+    original = copy.deepcopy(conf)
+
+    def run(output, lexicon=None):
+        extract_corpus(
+            [data / "pem_txt_tb.txt"],
+            conf=conf,
+            lexicon=lexicon,
+            output_dir=tmp_path / output,
+            cldf=True,
+            languages=data / "languages.csv",
+        )
+        return {
+            f.name: f.read_bytes()
+            for f in sorted((tmp_path / output / "cldf").iterdir())
+            if f.suffix == ".csv"
+        }
+
+    # repeated runs in one process get the same IDs
+    first = run("first")
+    assert run("second") == first
+    assert conf == original
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(
+            pool.map(
+                run,
+                ["a", "b", "c", "d"],
+                [None, data / "pem_lex_tb.txt", None, data / "pem_lex_tb.txt"],
+            )
+        )
+    assert results[0] == results[2] == first
+    assert results[1] == results[3]
+    # every errors.log only has the warnings of its run
+    for output in ["a", "c"]:
+        assert "chinoro" not in (tmp_path / output / "errors.log").read_text("utf-8")
+    assert "chinoro" in (tmp_path / "b" / "errors.log").read_text("utf-8")
+
+
+def test_segments(data, tmp_path, run_corpus):
+    import csv
+
+    # every character of the corpus is its own segment, # separates words
+    text = (data / "pem_txt_tb.txt").read_text(encoding="utf-8").lower()
+    graphemes = sorted(set(text) - set(" \t\n\\+-()/∅0?,=;"))
+    with open(tmp_path / "profile.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Grapheme", "IPA"])
+        writer.writerows([x, x] for x in graphemes)
+    run_corpus(".", "--segments", tmp_path / "profile.csv", lexicon=True, cldf=True)
+    ds = Dataset.from_metadata(tmp_path / "cldf" / "metadata.json")
+    assert ds.validate()
+    for table in ["wordforms.csv", "morphs.csv"]:
+        forms = list(ds[table])
+        assert forms
+        for form in forms:
+            name = form["Form"] if "Form" in form else form["Name"]
+            expected = name.lower().replace("-", "").replace(" ", "#")
+            assert form["Segments"] == list(expected)
+
+
+def test_background_error(data, tmp_path, monkeypatch):
+    import threading
+    import pytest
+    import unboxer
+    from unboxer.helpers import load_config
+
+    def fail(languages):
+        raise ValueError("broken languages file")
+
+    monkeypatch.setattr(unboxer, "load_languages", fail)
+    with pytest.raises(ValueError, match="broken languages file"):
+        unboxer.extract_corpus(
+            [data / "pem_txt_tb.txt"],
+            conf=load_config(data / "pemon.yaml"),
+            output_dir=tmp_path,
+            cldf=True,
+            languages=data / "languages.csv",
+        )
+    assert not [x for x in threading.enumerate() if x.name.startswith("unboxer")]
+
+
+def test_chunked_table(tmp_path):
+    from unboxer.chunks import ChunkedTable
+    from unboxer.helpers import compact_frame
+
+    df = pd.DataFrame({"ID": ["a", "b", "c", "d"], "Form": ["x", "x", "y", "y"]})
+    for spool_dir in [None, tmp_path]:
+        table = ChunkedTable("test", spool_dir)
+        table.append(compact_frame(df.iloc[:2]))
+        table.append(compact_frame(df.iloc[2:]))
+        # chunks stay categorical until they are written
+        assert all(x["Form"].dtype == "category" for x in table.chunks())
+        assert table.to_frame().equals(df)
+        assert list(table.records()) == df.to_dict("records")
+        table.to_csv(tmp_path / "test.csv", index=False)
+        assert pd.read_csv(tmp_path / "test.csv").equals(df)